@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Cold start import benchmark of the Lambda handlers - imports the modules of each handler entry point in a fresh
+interpreter with python -X importtime, and reports the median import time, the heaviest imports and the modules
+each handler must not load. Exits with an error when a handler loads one of them, or takes more than --max-ms
+Usage: python benchmarks/import_benchmark.py [--runs 5] [--top 8] [--max-ms 1000]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SERVERLESS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless')
+
+# the modules imported by each entry point, including the modules its code path imports lazily
+ENTRY_POINTS = {
+    'newsfeed.query_newsfeed': ['newsfeed', 'scraper'],
+    'newsfeed.evaluate_newsfeed': ['newsfeed'],
+    'watchlist.refresh': ['watchlist'],
+    'watchlist.check_keyword': ['watchlist'],
+}
+# top level packages an entry point must not load at import
+EXCLUDED = {
+    'newsfeed.query_newsfeed': ['pandas', 'pyarrow', 'psycopg'],
+    'newsfeed.evaluate_newsfeed': ['bs4', 'requests', 'lxml', 'pandas', 'pyarrow', 'psycopg', 'scraper'],
+    'watchlist.refresh': ['bs4', 'requests', 'lxml', 'pandas', 'pyarrow', 'psycopg', 'scraper'],
+    'watchlist.check_keyword': ['bs4', 'requests', 'lxml', 'pandas', 'pyarrow', 'psycopg', 'scraper'],
+}
+
+
+def measure(modules):
+    """
+    Import the modules in a fresh interpreter
+    :return: the total import time in ms, and the cumulative import time in ms of each imported module
+    """
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [SERVERLESS_DIR, environment.get('PYTHONPATH')]))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+                            env=environment, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    cumulative = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not name[1:].startswith(' '):
+            # top level import of the -c statement
+            total += int(cumulative_us)
+        cumulative[name.strip()] = int(cumulative_us) / 1000
+    return total / 1000, cumulative
+
+
+def run(runs, top, max_ms):
+    failures = []
+    for entry_point, modules in ENTRY_POINTS.items():
+        # the first run also compiles the modules
+        measure(modules)
+        results = [measure(modules) for _ in range(runs)]
+        total = statistics.median(total for total, cumulative in results)
+        cumulative = results[-1][1]
+        print("{0:<30} {1:>8.1f} ms".format(entry_point, total))
+        heaviest = sorted(((ms, name) for name, ms in cumulative.items() if '.' not in name), reverse=True)[:top]
+        for ms, name in heaviest:
+            print("    {0:<26} {1:>8.1f} ms".format(name, ms))
+        loaded = [package for package in EXCLUDED[entry_point] if package in cumulative]
+        if loaded:
+            failures.append("{0} loads {1}".format(entry_point, ", ".join(loaded)))
+        if max_ms is not None and total > max_ms:
+            failures.append("{0} imports in {1:.1f} ms, above {2} ms".format(entry_point, total, max_ms))
+    for failure in failures:
+        print("FAILED: " + failure)
+    return not failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="number of measured imports per entry point")
+    parser.add_argument('--top', type=int, default=8, help="number of heaviest top level imports listed")
+    parser.add_argument('--max-ms', type=float, default=None, help="maximal median import time of an entry point")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.runs, args.top, args.max_ms) else 1)
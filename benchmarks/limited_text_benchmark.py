@@ -0,0 +1,70 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Micro-benchmark of common.limited_text against the previous character by character implementation
+Usage: python benchmarks/limited_text_benchmark.py [--sizes 100000 500000 1000000] [--limit 5000] [--skip-legacy]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless'))
+import common
+
+WORDS = ['watchlist', 'newsfeed', 'Comprehend', 'Skywalker', 'financial', 'droid', 'café', 'naïve', 'Zürich',
+         '東京', 'news.', 'market', 'report,', 'analysis', 'Jedi', '—', 'article']
+
+
+def legacy_limited_text(input_text, size):
+    result = ""
+    if len(input_text.encode('utf-8')) > size:
+        for i in input_text:
+            if len((result + i).encode('utf-8')) < size:
+                result = result + i
+    else:
+        result = input_text
+    return result
+
+
+def generate_text(size):
+    """
+    Generate a mixed ASCII and multi-byte text of about size bytes
+    """
+    random.seed(size)
+    words = []
+    length = 0
+    while length < size:
+        word = random.choice(WORDS)
+        words.append(word)
+        length += len(word.encode('utf-8')) + 1
+    return " ".join(words)
+
+
+def run(sizes, limit, repeat, skip_legacy):
+    print("{0:>10} {1:>16} {2:>16} {3:>10}".format("bytes", "limited_text ms", "legacy ms", "speedup"))
+    for size in sizes:
+        text = generate_text(size)
+        current = min(timeit.repeat(lambda: common.limited_text(text, limit), number=1, repeat=repeat)) * 1000
+        result = common.limited_text(text, limit)
+        assert text.startswith(result)
+        assert len(result.encode('utf-8')) < limit <= len(text[:len(result) + 1].encode('utf-8'))
+        if skip_legacy:
+            print("{0:>10} {1:>16.3f} {2:>16} {3:>10}".format(size, current, "-", "-"))
+            continue
+        legacy = min(timeit.repeat(lambda: legacy_limited_text(text, limit), number=1, repeat=1)) * 1000
+        print("{0:>10} {1:>16.3f} {2:>16.3f} {3:>9.0f}x".format(size, current, legacy, legacy / current))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 250000, 500000, 1000000])
+    parser.add_argument('--limit', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+    common.log.setLevel(logging.WARNING)
+    run(args.sizes, args.limit, args.repeat, args.skip_legacy)
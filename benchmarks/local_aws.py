@@ -0,0 +1,498 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Local stand-ins of the AWS services used by the functions - S3, SQS, SNS, Secrets Manager, Comprehend and the
+RDS Data API(backed by SQLite with the soundex and levenshtein functions of the matcher module) - and of the
+newsfeed web pages. Every call sleeps for the configured latency of its service and is recorded, so the benchmarks
+can report call counts and latencies per API. install() registers them in the common clients registry
+"""
+
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+import botocore.exceptions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless'))
+import common
+import matcher
+
+# Default latency of a call in ms per service, http is the download of a newsfeed web page
+DEFAULT_LATENCIES = {
+    's3': 5,
+    'sqs': 5,
+    'sns': 5,
+    'secretsmanager': 20,
+    'comprehend': 20,
+    'rds-data': 5,
+    'http': 50
+}
+COMPREHEND_TEXT_LIMIT = 5000
+COMPREHEND_BATCH_SIZE = 25
+
+
+class CallRecorder:
+    """
+    Records the duration of every call per API, shared by all the stand-ins
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = defaultdict(list)
+
+    def record(self, api, duration):
+        with self.lock:
+            self.durations[api].append(duration)
+
+    def reset(self):
+        with self.lock:
+            self.durations.clear()
+
+
+recorder = CallRecorder()
+
+
+class LocalService:
+    """
+    Base of the stand-ins, call() sleeps for the service latency and records the call duration
+    """
+    service_name = None
+
+    def __init__(self, latency_ms=None):
+        self.latency = (DEFAULT_LATENCIES[self.service_name] if latency_ms is None else latency_ms) / 1000.0
+
+    def call(self, api, function, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return function(*args, **kwargs)
+        finally:
+            recorder.record("{0}.{1}".format(self.service_name, api), time.perf_counter() - start)
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class LocalS3(LocalService):
+    service_name = 's3'
+
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self, latency_ms=None):
+        super().__init__(latency_ms)
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        def put():
+            self.objects[(Bucket, Key)] = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+            return {'ETag': '"{0}"'.format(uuid.uuid4().hex)}
+        return self.call('put_object', put)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        def get():
+            if (Bucket, Key) not in self.objects:
+                raise NoSuchKey("The specified key does not exist: {0}".format(Key))
+            content = self.objects[(Bucket, Key)]
+            return {'Body': io.BytesIO(content), 'ContentLength': len(content)}
+        return self.call('get_object', get)
+
+
+class LocalSQS(LocalService):
+    service_name = 'sqs'
+
+    def __init__(self, latency_ms=None):
+        super().__init__(latency_ms)
+        self.lock = threading.Lock()
+        self.queues = defaultdict(list)
+
+    def get_queue_url(self, QueueName):
+        return self.call('get_queue_url', lambda: {'QueueUrl': 'https://sqs.local/' + QueueName})
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        def send():
+            message_id = str(uuid.uuid4())
+            with self.lock:
+                self.queues[QueueUrl].append({'messageId': message_id, 'body': MessageBody})
+            return {'MessageId': message_id}
+        return self.call('send_message', send)
+
+    def send_message_batch(self, QueueUrl, Entries):
+        def send():
+            if len(Entries) > 10:
+                raise ValueError("TooManyEntriesInBatchRequest")
+            successful = []
+            with self.lock:
+                for entry in Entries:
+                    message_id = str(uuid.uuid4())
+                    self.queues[QueueUrl].append({'messageId': message_id, 'body': entry['MessageBody']})
+                    successful.append({'Id': entry['Id'], 'MessageId': message_id})
+            return {'Successful': successful, 'Failed': []}
+        return self.call('send_message_batch', send)
+
+    def receive_events(self, batch_size=10):
+        """
+        Drain the queues into SQS Lambda events of up to batch_size records
+        """
+        with self.lock:
+            messages = [message for queue in self.queues.values() for message in queue]
+            self.queues.clear()
+        return [{'Records': messages[start:start + batch_size]} for start in range(0, len(messages), batch_size)]
+
+
+class LocalSNS(LocalService):
+    """
+    SNS stand-in without publish_batch, same as the boto3 versions before 1.20.33
+    """
+    service_name = 'sns'
+
+    def __init__(self, latency_ms=None):
+        super().__init__(latency_ms)
+        self.lock = threading.Lock()
+        self.messages = []
+
+    def publish(self, TopicArn, Message, **kwargs):
+        def publish():
+            with self.lock:
+                self.messages.append(Message)
+            return {'MessageId': str(uuid.uuid4())}
+        return self.call('publish', publish)
+
+
+class LocalBatchSNS(LocalSNS):
+    """
+    SNS stand-in with publish_batch
+    """
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        def publish():
+            if len(PublishBatchRequestEntries) > 10:
+                raise ValueError("TooManyEntriesInBatchRequest")
+            with self.lock:
+                self.messages.extend(entry['Message'] for entry in PublishBatchRequestEntries)
+            return {'Successful': [{'Id': entry['Id'], 'MessageId': str(uuid.uuid4())}
+                                   for entry in PublishBatchRequestEntries], 'Failed': []}
+        return self.call('publish_batch', publish)
+
+
+class LocalSecretsManager(LocalService):
+    service_name = 'secretsmanager'
+
+    def __init__(self, secrets, latency_ms=None):
+        super().__init__(latency_ms)
+        self.secrets = secrets
+
+    def get_secret_value(self, SecretId):
+        return self.call('get_secret_value', lambda: {'SecretString': json.dumps(self.secrets[SecretId])})
+
+
+class LocalComprehend(LocalService):
+    """
+    Comprehend stand-in - capitalized word sequences are the entities and key phrases, the sentiment is neutral
+    With a quota, the calls of an API beyond quota calls in the last second fail with a ThrottlingException
+    """
+    service_name = 'comprehend'
+    ENTITY = re.compile(r"[A-Z][a-z]+(?: [A-Z][a-z]+)*")
+
+    def __init__(self, latency_ms=None, quota=None):
+        super().__init__(latency_ms)
+        self.quota = quota
+        self.lock = threading.Lock()
+        self.calls = defaultdict(deque)
+
+    def call(self, api, function, *args, **kwargs):
+        if self.quota:
+            with self.lock:
+                now = time.monotonic()
+                calls = self.calls[api]
+                while calls and now - calls[0] >= 1.0:
+                    calls.popleft()
+                if len(calls) >= self.quota:
+                    recorder.record("comprehend.{0}.throttled".format(api), 0.0)
+                    raise botocore.exceptions.ClientError(
+                        {'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, api)
+                calls.append(now)
+        return super().call(api, function, *args, **kwargs)
+
+    def validate(self, text):
+        if not text or len(text.encode('utf-8')) > COMPREHEND_TEXT_LIMIT:
+            raise ValueError("TextSizeLimitExceededException")
+
+    def entities(self, text):
+        self.validate(text)
+        return {'Entities': [{'Text': found.group(), 'Type': 'PERSON', 'Score': 0.99,
+                              'BeginOffset': found.start(), 'EndOffset': found.end()}
+                             for found in self.ENTITY.finditer(text)]}
+
+    def key_phrases(self, text):
+        self.validate(text)
+        return {'KeyPhrases': [{'Text': found.group(), 'Score': 0.95,
+                                'BeginOffset': found.start(), 'EndOffset': found.end()}
+                               for found in self.ENTITY.finditer(text)]}
+
+    def sentiment(self, text):
+        self.validate(text)
+        return {'Sentiment': 'NEUTRAL',
+                'SentimentScore': {'Positive': 0.1, 'Negative': 0.1, 'Neutral': 0.75, 'Mixed': 0.05}}
+
+    def detect_entities(self, Text, LanguageCode):
+        return self.call('detect_entities', self.entities, Text)
+
+    def detect_key_phrases(self, Text, LanguageCode):
+        return self.call('detect_key_phrases', self.key_phrases, Text)
+
+    def detect_sentiment(self, Text, LanguageCode):
+        return self.call('detect_sentiment', self.sentiment, Text)
+
+    def batch(self, detect, texts):
+        if len(texts) > COMPREHEND_BATCH_SIZE:
+            raise ValueError("BatchSizeLimitExceededException")
+        results = []
+        errors = []
+        for index, text in enumerate(texts):
+            try:
+                results.append(dict(detect(text), Index=index))
+            except ValueError as e:
+                errors.append({'Index': index, 'ErrorCode': str(e), 'ErrorMessage': str(e)})
+        return {'ResultList': results, 'ErrorList': errors}
+
+    def batch_detect_entities(self, TextList, LanguageCode):
+        return self.call('batch_detect_entities', self.batch, self.entities, TextList)
+
+    def batch_detect_key_phrases(self, TextList, LanguageCode):
+        return self.call('batch_detect_key_phrases', self.batch, self.key_phrases, TextList)
+
+    def batch_detect_sentiment(self, TextList, LanguageCode):
+        return self.call('batch_detect_sentiment', self.batch, self.sentiment, TextList)
+
+
+class LocalDataApi(LocalService):
+    """
+    RDS Data API stand-in backed by an in-memory SQLite database. The Postgres specific statements of the watchlist
+    module are rewritten to SQLite, soundex and levenshtein_less_equal are the Python ports of fuzzystrmatch
+    """
+    service_name = 'rds-data'
+    REWRITES = [
+        (re.compile(r"json_array_elements_text\(CAST\((:\w+) AS json\)\) AS (\w+)\((\w+)\)", re.I),
+         r"(SELECT value AS \3 FROM json_each(\1)) AS \2"),
+        (re.compile(r"\bbigserial PRIMARY KEY\b", re.I), "INTEGER PRIMARY KEY AUTOINCREMENT"),
+        (re.compile(r"\bON COMMIT DROP\b", re.I), ""),
+        # SQLite needs AS before the alias of the table of a DELETE
+        (re.compile(r"\bDELETE FROM (\w+) (?!WHERE\b)(\w+)", re.I), r"DELETE FROM \1 AS \2"),
+    ]
+    # SQLite has no table locks, extensions or trigram index, the LIKE filters scan the table instead
+    IGNORED = re.compile(r"^\s*(LOCK TABLE|create extension|CREATE INDEX .* USING gin)", re.I)
+    ADD_COLUMN = re.compile(r"^\s*ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+)", re.I)
+    TEMPORARY_TABLE = re.compile(r"CREATE TEMPORARY TABLE (\w+)", re.I)
+
+    def __init__(self, latency_ms=None, path=':memory:'):
+        super().__init__(latency_ms)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.create_function('soundex', 1, lambda text: None if text is None else matcher.soundex(text),
+                                        deterministic=True)
+        self.connection.create_function('levenshtein_less_equal', 3, matcher.levenshtein_less_equal,
+                                        deterministic=True)
+        self.connection.create_function('levenshtein', 2, matcher.levenshtein, deterministic=True)
+        # the SQLite lower only folds ASCII letters
+        self.connection.create_function('lower', 1, lambda text: None if text is None else text.lower(),
+                                        deterministic=True)
+        self.connection.create_function('now', 0, lambda: datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f"))
+        self.connection.create_function('timezone', 2, lambda zone, timestamp: timestamp)
+        self.connection.create_function('char_length', 1, lambda text: None if text is None else len(text),
+                                        deterministic=True)
+        self.connection.create_function('least', -1, min, deterministic=True)
+        self.connection.create_function('greatest', -1, max, deterministic=True)
+        self.transaction_id = None
+        self.temporary_tables = []
+
+    def translate(self, sql):
+        for pattern, replacement in self.REWRITES:
+            sql = pattern.sub(replacement, sql)
+        return sql
+
+    @staticmethod
+    def get_parameters(parameters):
+        values = {}
+        for parameter in parameters or []:
+            value = parameter['value']
+            if value.get('isNull'):
+                values[parameter['name']] = None
+            else:
+                values[parameter['name']] = next(iter(value.values()))
+        return values
+
+    @staticmethod
+    def get_field(value):
+        if value is None:
+            return {'isNull': True}
+        if isinstance(value, bool):
+            return {'booleanValue': value}
+        if isinstance(value, int):
+            return {'longValue': value}
+        if isinstance(value, float):
+            return {'doubleValue': value}
+        if isinstance(value, bytes):
+            return {'blobValue': value}
+        return {'stringValue': str(value)}
+
+    def run(self, sql, parameter_sets, transaction_id):
+        with self.lock:
+            if transaction_id is not None and transaction_id != self.transaction_id:
+                raise ValueError("Unknown transaction {0}".format(transaction_id))
+            if self.IGNORED.match(sql):
+                return [], 0
+            add_column = self.ADD_COLUMN.match(sql)
+            if add_column:
+                columns = [row[1].lower() for row in
+                           self.connection.execute("PRAGMA table_info({0})".format(add_column.group(1)))]
+                if add_column.group(2).lower() in columns:
+                    return [], 0
+                sql = re.sub(r"\bIF NOT EXISTS\b", "", sql, flags=re.I)
+            temporary_table = self.TEMPORARY_TABLE.search(sql)
+            if temporary_table:
+                self.temporary_tables.append(temporary_table.group(1))
+            cursor = self.connection.cursor()
+            records = []
+            updated = 0
+            for parameters in parameter_sets:
+                cursor.execute(self.translate(sql), self.get_parameters(parameters))
+                records.extend([self.get_field(value) for value in row] for row in cursor.fetchall())
+                updated += max(cursor.rowcount, 0)
+            return records, updated
+
+    def execute_statement(self, secretArn, database, resourceArn, sql, parameters=None, transactionId=None,
+                          **kwargs):
+        def execute():
+            records, updated = self.run(sql, [parameters], transactionId)
+            return {'numberOfRecordsUpdated': updated, 'records': records,
+                    'ResponseMetadata': {'RequestId': str(uuid.uuid4()), 'HTTPStatusCode': 200}}
+        return self.call('execute_statement', execute)
+
+    def batch_execute_statement(self, secretArn, database, resourceArn, sql, parameterSets, transactionId=None,
+                                **kwargs):
+        def execute():
+            self.run(sql, parameterSets, transactionId)
+            return {'updateResults': [{'generatedFields': []} for _ in parameterSets]}
+        return self.call('batch_execute_statement', execute)
+
+    def begin_transaction(self, secretArn, database, resourceArn, **kwargs):
+        def begin():
+            # one transaction at a time, the lock is held until the commit or the rollback
+            self.lock.acquire()
+            self.connection.execute("BEGIN")
+            self.transaction_id = str(uuid.uuid4())
+            return {'transactionId': self.transaction_id}
+        return self.call('begin_transaction', begin)
+
+    def end_transaction(self, transaction_id, statement):
+        if transaction_id != self.transaction_id:
+            raise ValueError("Unknown transaction {0}".format(transaction_id))
+        self.connection.execute(statement)
+        for table in self.temporary_tables:
+            self.connection.execute("DROP TABLE IF EXISTS temp.{0}".format(table))
+        self.temporary_tables = []
+        self.transaction_id = None
+        self.lock.release()
+
+    def commit_transaction(self, secretArn, resourceArn, transactionId):
+        def commit():
+            self.end_transaction(transactionId, "COMMIT")
+            return {'transactionStatus': 'Transaction Committed'}
+        return self.call('commit_transaction', commit)
+
+    def rollback_transaction(self, secretArn, resourceArn, transactionId):
+        def rollback():
+            self.end_transaction(transactionId, "ROLLBACK")
+            return {'transactionStatus': 'Rollback Complete'}
+        return self.call('rollback_transaction', rollback)
+
+
+class Response:
+    """
+    Streamed response of a newsfeed web page
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.status_code = 200
+        self.headers = {'Content-Type': 'text/html; charset=utf-8', 'Content-Length': str(len(content))}
+        self.encoding = 'utf-8'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+
+class LocalWeb(LocalService):
+    """
+    Stand-in of the requests session of the scraper, serving the registered pages
+    """
+    service_name = 'http'
+
+    def __init__(self, latency_ms=None):
+        super().__init__(latency_ms)
+        self.pages = {}
+
+    def get(self, url, **kwargs):
+        def get():
+            if url not in self.pages:
+                raise ValueError("404 Not Found: {0}".format(url))
+            return Response(self.pages[url])
+        return self.call('get', get)
+
+
+def install(config, secret_name='LocalSecret', latencies=None, publish_batch=True, comprehend_quota=None):
+    """
+    Create the stand-ins and register them in the common clients registry, the configuration is served by the
+    Secrets Manager stand-in
+    :param config: the configuration dictionary
+    :param secret_name: the secret name, set to the SECRET environment variable
+    :param latencies: dictionary of service name to its latency in ms, default is DEFAULT_LATENCIES
+    :param publish_batch: False to mimic the boto3 versions without SNS publish_batch
+    :param comprehend_quota: calls per second of each Comprehend API, None for no quota
+    :return: dictionary of service name to its stand-in
+    """
+    import scraper
+    latencies = latencies or {}
+    services = {
+        's3': LocalS3(latencies.get('s3')),
+        'sqs': LocalSQS(latencies.get('sqs')),
+        'sns': LocalBatchSNS(latencies.get('sns')) if publish_batch else LocalSNS(latencies.get('sns')),
+        'secretsmanager': LocalSecretsManager({secret_name: config}, latencies.get('secretsmanager')),
+        'comprehend': LocalComprehend(latencies.get('comprehend'), comprehend_quota),
+        'rds-data': LocalDataApi(latencies.get('rds-data')),
+        'http': LocalWeb(latencies.get('http'))
+    }
+    os.environ['SECRET'] = secret_name
+    size = common.configure_concurrency(config)
+    with common.cache_lock:
+        common.clients.clear()
+        common.queue_urls.clear()
+        common.config_cache.clear()
+        for service_name, service in services.items():
+            if service_name == 'secretsmanager':
+                common.clients[(service_name, "us-east-2", size)] = service
+            elif service_name != 'http':
+                common.clients[(service_name, None, size)] = service
+    scraper.session = services['http']
+    recorder.reset()
+    return services
@@ -0,0 +1,213 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Benchmark of the in-process watchlist matcher - index build time and query time on a synthetic watchlist,
+with parity checks of soundex against known Postgres fuzzystrmatch outputs and of the matches against a brute
+force scan of the watchlist. The phrase matcher is timed scanning a synthetic article, and its hits are checked
+against a brute force search of each entity. The keyword pre-filter is checked to pass every keyword with a match,
+and its rejection rate is reported
+Usage: python benchmarks/matcher_benchmark.py [--entities 20000] [--keywords 200] [--parity-keywords 20]
+       [--text-bytes 100000]
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless'))
+import matcher
+
+# soundex outputs of the Postgres fuzzystrmatch extension
+KNOWN_SOUNDEX = {
+    "Anne": "A500",
+    "Ann": "A500",
+    "Andrew": "A536",
+    "Margaret": "M626",
+    "Robert": "R163",
+    "Rupert": "R163",
+    "Rubin": "R150",
+    "Tymczak": "T522",
+    "Pfister": "P236",
+    "Jackson": "J250",
+    "Lee": "L000",
+    "Gutierrez": "G362",
+    "": "",
+    "123": "",
+}
+
+
+def generate_entities(count):
+    random.seed(count)
+    entities = []
+    for _ in range(count):
+        words = random.choice([1, 1, 2, 2, 3])
+        entities.append(" ".join(
+            "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(3, 9))).capitalize()
+            for _ in range(words)))
+    return entities
+
+
+def generate_keywords(entities, count):
+    """
+    Half of the keywords are entities with up to 3 random edits, the others are random words
+    """
+    random.seed(count)
+    keywords = []
+    for index in range(count):
+        if index % 2:
+            keywords.append("".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(2, 12))))
+            continue
+        keyword = list(random.choice(entities))
+        for _ in range(random.randint(0, 3)):
+            position = random.randrange(len(keyword))
+            operation = random.choice(['insert', 'delete', 'substitute'])
+            if operation == 'insert':
+                keyword.insert(position, random.choice(string.ascii_lowercase))
+            elif operation == 'delete' and len(keyword) > 1:
+                del keyword[position]
+            else:
+                keyword[position] = random.choice(string.ascii_lowercase)
+        keywords.append("".join(keyword))
+    return keywords
+
+
+def brute_force_match(records, keyword):
+    keyword_lowered = keyword.lower()
+    return [record for record in records
+            if matcher.soundex(record[0]['stringValue'].lower()) == matcher.soundex(keyword_lowered)
+            or matcher.levenshtein(record[0]['stringValue'].lower(), keyword_lowered) <= matcher.MAX_DISTANCE]
+
+
+def generate_text(entities, size):
+    """
+    Random words with a watchlist entity every 50 words or so, in random case and punctuation
+    """
+    random.seed(size)
+    words = []
+    length = 0
+    while length < size:
+        if random.random() < 0.02:
+            word = random.choice(entities)
+            word = random.choice([word.upper(), word.lower(), word.replace(" ", ", ")])
+        else:
+            word = "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(1, 9)))
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def brute_force_phrases(records, text):
+    words = [(word.start(), word.end(), matcher.normalize_word(word.group()))
+             for word in matcher.PHRASE_WORD.finditer(text)]
+    hits = []
+    for record in records:
+        phrase = matcher.normalize_phrase(record[0]['stringValue'])
+        for index in range(len(words) - len(phrase) + 1):
+            if [word for start, end, word in words[index:index + len(phrase)]] == phrase:
+                hits.append((words[index][0], words[index + len(phrase) - 1][1], record[0]['stringValue']))
+    return sorted(hits)
+
+
+def check_soundex():
+    for text, expected in KNOWN_SOUNDEX.items():
+        assert matcher.soundex(text) == expected, "soundex({0!r}) is {1}, expected {2}".format(
+            text, matcher.soundex(text), expected)
+    print("soundex parity: {0} known fuzzystrmatch outputs ok".format(len(KNOWN_SOUNDEX)))
+
+
+def check_levenshtein(keywords):
+    pairs = 0
+    for source in keywords:
+        for target in keywords[:20]:
+            distance = matcher.levenshtein(source, target)
+            bounded = matcher.levenshtein_less_equal(source, target, matcher.MAX_DISTANCE)
+            assert bounded == distance if distance <= matcher.MAX_DISTANCE else bounded > matcher.MAX_DISTANCE
+            pairs += 1
+    print("levenshtein_less_equal parity: {0} pairs ok".format(pairs))
+
+
+def run_phrases(records, text_bytes, parity_count):
+    start = time.perf_counter()
+    phrase_matcher = matcher.PhraseMatcher(records)
+    build = time.perf_counter() - start
+    text = generate_text([record[0]['stringValue'] for record in records], text_bytes)
+
+    start = time.perf_counter()
+    hits = phrase_matcher.scan(text)
+    scan = time.perf_counter() - start
+
+    # the brute force search is quadratic, the parity is checked on a sample of the watchlist
+    parity_records = records[:parity_count * 10]
+    parity_matcher = matcher.PhraseMatcher(parity_records)
+    parity_text = generate_text([record[0]['stringValue'] for record in parity_records], 10000)
+    assert sorted((hit['start'], hit['end'], hit['record'][0]['stringValue'])
+                  for hit in parity_matcher.scan(parity_text)) == brute_force_phrases(parity_records, parity_text)
+    print("phrase parity: {0} entities equal to the brute force search".format(len(parity_records)))
+    print("phrases {0}, build {1:.1f} ms, text {2} bytes, {3} hits, scan {4:.2f} ms ({5:.1f} MB/s)".format(
+        len(records), build * 1000, len(text), len(hits), scan * 1000, len(text) / scan / 1e6))
+
+
+def run_prefilter(records, keywords, watchlist_matcher):
+    start = time.perf_counter()
+    prefilter = matcher.KeywordPrefilter.from_records(records)
+    build = time.perf_counter() - start
+    size = len(json.dumps(prefilter.to_dict()))
+
+    start = time.perf_counter()
+    passed = [prefilter.may_match(keyword) for keyword in keywords]
+    check = time.perf_counter() - start
+    for keyword, may_match in zip(keywords, passed):
+        assert may_match or not watchlist_matcher.match(keyword), keyword
+    unmatched = [keyword for keyword in keywords if not watchlist_matcher.match(keyword)]
+    rejected = sum(not prefilter.may_match(keyword) for keyword in unmatched)
+    print("pre-filter build {0:.1f} ms, {1} bytes, {2:.3f} ms per keyword, passed {3} of {4} keywords, "
+          "rejected {5} of {6} keywords without a match".format(
+              build * 1000, size, check / len(keywords) * 1000, sum(passed), len(keywords), rejected,
+              len(unmatched)))
+
+
+def run(entity_count, keyword_count, parity_count, text_bytes):
+    entities = generate_entities(entity_count)
+    records = [[{'stringValue': entity}, {'stringValue': 'PERSON'}, {'stringValue': '2021-01-01 00:00:00'}]
+               for entity in entities]
+    keywords = generate_keywords(entities, keyword_count)
+
+    check_soundex()
+    check_levenshtein(keywords)
+
+    start = time.perf_counter()
+    watchlist_matcher = matcher.WatchlistMatcher(records)
+    build = time.perf_counter() - start
+
+    durations = []
+    matches = 0
+    for keyword in keywords:
+        start = time.perf_counter()
+        matches += len(watchlist_matcher.match(keyword))
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+
+    for keyword in keywords[:parity_count]:
+        assert watchlist_matcher.match(keyword) == brute_force_match(records, keyword), keyword
+    print("match parity: {0} keywords equal to the brute force scan".format(min(parity_count, len(keywords))))
+
+    print("entities {0}, build {1:.1f} ms".format(entity_count, build * 1000))
+    print("keywords {0}, matches {1}, mean {2:.2f} ms, p50 {3:.2f} ms, p99 {4:.2f} ms".format(
+        len(keywords), matches, sum(durations) / len(durations) * 1000, durations[len(durations) // 2] * 1000,
+        durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000))
+    run_prefilter(records, keywords, watchlist_matcher)
+    run_phrases(records, text_bytes, parity_count)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entities', type=int, default=20000)
+    parser.add_argument('--keywords', type=int, default=200)
+    parser.add_argument('--parity-keywords', type=int, default=20)
+    parser.add_argument('--text-bytes', type=int, default=100000)
+    args = parser.parse_args()
+    run(args.entities, args.keywords, args.parity_keywords, args.text_bytes)
@@ -0,0 +1,186 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+End to end benchmark of the functions against the local stand-ins of benchmarks/local_aws.py - refreshes a synthetic
+watchlist, submits synthetic articles to query_newsfeed, evaluates the queued messages with evaluate_newsfeed in SQS
+batches and checks keywords with check_keyword. Reports the throughput and p50/p99 latency per stage, and the call
+count and p50/p99 latency per AWS API
+Usage: python benchmarks/pipeline_benchmark.py [--entities 1000] [--articles 100] [--article-bytes 4000]
+       [--keywords 50] [--match-rate 0.2] [--bulk] [--latency comprehend=30 s3=10] [--comprehend-quota 20]
+       [--config '{"comprehend-batch-mode": "true", "evaluate-concurrency": "4"}']
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import string
+import sys
+import time
+from collections import defaultdict
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import local_aws
+import common
+import database
+import newsfeed
+import watchlist
+
+CONFIG = {
+    'newsfeed-bucket': 'local-newsfeed-bucket',
+    'incoming-newsfeed-queue': 'local-incoming-newsfeed',
+    'sns-notification-topic': 'arn:aws:sns:us-east-2:000000000000:local-notification',
+    'db-secret': 'arn:aws:secretsmanager:us-east-2:000000000000:secret:local-db',
+    'db-cluster-arn': 'arn:aws:rds:us-east-2:000000000000:cluster:local'
+}
+WORDS = ['market', 'report', 'analysis', 'growth', 'shares', 'quarter', 'droid', 'announced', 'the', 'of', 'and',
+         'investors', 'said', 'new', 'product', 'launch', 'according', 'to', 'a', 'statement']
+
+
+def generate_name():
+    return " ".join("".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(4, 8))).capitalize()
+                    for _ in range(2))
+
+
+def generate_article(entities, size, match_rate):
+    """
+    Generate a news page, the article mentions watchlist entities with probability match_rate, else unknown names
+    """
+    words = []
+    length = 0
+    while length < size:
+        if random.random() < 0.03:
+            word = random.choice(entities) if random.random() < match_rate else generate_name()
+        else:
+            word = random.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    paragraphs = " ".join(words).split(" the ")
+    return ('<html><head><title>news</title></head><body><nav>home news</nav>'
+            '<article itemprop="articleBody">{0}</article><footer>contact</footer></body></html>').format(
+        "".join("<p>{0}.</p>".format(paragraph) for paragraph in paragraphs)).encode('utf-8')
+
+
+class Stages:
+    """
+    Durations of the handler calls per stage
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.items = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def run(self, stage, function, items=1):
+        start = time.perf_counter()
+        response = function()
+        self.durations[stage].append(time.perf_counter() - start)
+        self.items[stage] += items
+        if isinstance(response, dict) and response.get('statusCode', 200) != 200:
+            self.errors[stage] += 1
+        return response
+
+
+def percentile(durations, fraction):
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(stages):
+    print("{0:<30} {1:>7} {2:>7} {3:>7} {4:>10} {5:>10} {6:>10} {7:>10}".format(
+        "stage", "calls", "items", "errors", "total s", "items/s", "p50 ms", "p99 ms"))
+    for stage, durations in stages.durations.items():
+        total = sum(durations)
+        print("{0:<30} {1:>7} {2:>7} {3:>7} {4:>10.2f} {5:>10.1f} {6:>10.1f} {7:>10.1f}".format(
+            stage, len(durations), stages.items[stage], stages.errors[stage], total,
+            stages.items[stage] / total if total else 0, percentile(durations, 0.5) * 1000,
+            percentile(durations, 0.99) * 1000))
+    print()
+    print("{0:<40} {1:>7} {2:>10} {3:>10}".format("api", "calls", "p50 ms", "p99 ms"))
+    for api, durations in sorted(local_aws.recorder.durations.items()):
+        print("{0:<40} {1:>7} {2:>10.1f} {3:>10.1f}".format(
+            api, len(durations), percentile(durations, 0.5) * 1000, percentile(durations, 0.99) * 1000))
+
+
+def run(args):
+    random.seed(args.seed)
+    config = dict(CONFIG, **args.config)
+    latencies = dict(latency.split('=') for latency in args.latency)
+    services = local_aws.install(config, latencies={service: float(ms) for service, ms in latencies.items()},
+                                 publish_batch=not args.no_publish_batch, comprehend_quota=args.comprehend_quota)
+    database.db_backend = None
+    watchlist.invalidate_matcher()
+    common.metrics_sink = common.MemoryMetricsSink()
+    stages = Stages()
+
+    entities = list(dict.fromkeys(generate_name() for _ in range(args.entities)))
+    stages.run('watchlist.refresh', lambda: watchlist.refresh({'body': json.dumps({
+        'refresh_list_from_bucket': False,
+        'watchlist': [{'entity': entity, 'entity_type': 'person'} for entity in entities]})}, None),
+        len(entities))
+
+    urls = []
+    for index in range(args.articles):
+        url = "https://news.local/article/{0}".format(index)
+        services['http'].pages[url] = generate_article(entities, args.article_bytes, args.match_rate)
+        urls.append(url)
+    options = {"extract_entities": "true", "extract_keyphrase": "true", "extract_sentiment": "true"}
+    if args.bulk:
+        for start in range(0, len(urls), args.bulk_size):
+            batch = urls[start:start + args.bulk_size]
+            stages.run('newsfeed.query_newsfeed bulk', lambda: newsfeed.query_newsfeed({'body': json.dumps({
+                'urls': [{'url': url, 'html_tag': 'article', 'html_attribute': {'itemprop': 'articleBody'}}
+                         for url in batch],
+                'options': options})}, None), len(batch))
+    else:
+        for index, url in enumerate(urls):
+            stages.run('newsfeed.query_newsfeed', lambda: newsfeed.query_newsfeed({'body': json.dumps({
+                'url': url, 'html_tag': 'article', 'html_attribute': {'itemprop': 'articleBody'},
+                'newsfeed_name': "news_{0}".format(index), 'options': options})}, None))
+
+    for event in services['sqs'].receive_events(args.batch_size):
+        stages.run('newsfeed.evaluate_newsfeed', lambda: newsfeed.evaluate_newsfeed(event, None),
+                   len(event['Records']))
+
+    keywords = [random.choice(entities) if random.random() < 0.5 else generate_name() for _ in range(args.keywords)]
+    for start in range(0, len(keywords), 10):
+        stages.run('watchlist.check_keyword', lambda: watchlist.check_keyword(
+            {'body': json.dumps({'keywords': keywords[start:start + 10]})}, None), len(keywords[start:start + 10]))
+
+    report(stages)
+    print()
+    print("notifications published: {0}".format(len(services['sns'].messages)))
+    # summed metrics of the invocations - keywords, bytes sent, pre-filter pass/reject counts
+    totals = defaultdict(int)
+    for document in common.metrics_sink.documents:
+        for name, value in document.items():
+            if isinstance(value, (int, float)) and not name.endswith(('.duration', '.count', '.errors')):
+                totals[name] += value
+    for name, value in sorted(totals.items()):
+        print("{0}: {1}".format(name, value))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entities', type=int, default=1000, help="number of watchlist entities")
+    parser.add_argument('--articles', type=int, default=100, help="number of articles")
+    parser.add_argument('--article-bytes', type=int, default=4000, help="size of the article text")
+    parser.add_argument('--match-rate', type=float, default=0.2,
+                        help="probability that a name in an article is a watchlist entity")
+    parser.add_argument('--keywords', type=int, default=50, help="number of keywords checked with check_keyword")
+    parser.add_argument('--batch-size', type=int, default=10, help="number of SQS messages per evaluate_newsfeed")
+    parser.add_argument('--bulk', action='store_true', help="submit the articles with the query_newsfeed bulk mode")
+    parser.add_argument('--bulk-size', type=int, default=50, help="number of articles per bulk request")
+    parser.add_argument('--latency', nargs='*', default=[],
+                        help="service=ms latencies, services are {0}".format(", ".join(local_aws.DEFAULT_LATENCIES)))
+    parser.add_argument('--no-publish-batch', action='store_true', help="SNS without publish_batch")
+    parser.add_argument('--comprehend-quota', type=int, default=None,
+                        help="calls per second of each Comprehend API, above it the calls are throttled")
+    parser.add_argument('--config', type=json.loads, default={}, help="configuration keys of the secret, as JSON")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true', help="show the function logs")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    run(args)
@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Benchmark of the watchlist keyword query with the direct Postgres backend, against a local PostgreSQL with the
+fuzzystrmatch and pg_trgm extensions. For each watchlist size the synthetic watchlist is applied with the refresh
+statements, then keywords are matched with the indexed query and with the previous full scan query, the results of
+both are checked to be equal and their p50/p99 latency is reported
+The watchlist tables of the database are replaced, use a scratch database
+Usage: python benchmarks/postgres_backend_benchmark.py --dsn "host=localhost dbname=scratch user=postgres"
+       [--sizes 1000 10000 100000] [--keywords 100] [--batch-size 10] [--no-full-scan]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless'))
+import common
+import matcher_benchmark
+import watchlist
+
+# the keyword query before the match columns and indexes
+FULL_SCAN_QUERY = "SELECT k.keyword, w.entity, w.entity_type, w.create_datetime " \
+                  "FROM (SELECT DISTINCT keyword " \
+                  "FROM json_array_elements_text(CAST(:input_keywords AS json)) AS input(keyword)) k " \
+                  "JOIN watchlist w ON soundex(lower(w.entity)) = soundex(lower(k.keyword)) " \
+                  "OR levenshtein_less_equal(lower(w.entity), lower(k.keyword), 2) <= 2"
+SECRET_NAME = 'LocalPostgres'
+
+
+def percentile(durations, fraction):
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def query(statement, keywords):
+    start = time.perf_counter()
+    response = watchlist.execute_statement(statement, [
+        {'name': 'input_keywords', 'value': {'stringValue': json.dumps(keywords)}}])
+    return time.perf_counter() - start, sorted(json.dumps(record) for record in response['records'])
+
+
+def run(args):
+    os.environ['SECRET'] = SECRET_NAME
+    common.config_cache[SECRET_NAME] = ({'db-backend': 'postgres', 'db-dsn': args.dsn}, float('inf'))
+    common.metrics_sink = None
+    print("{0:>9} {1:>10} {2:>9} {3:>12} {4:>12} {5:>12} {6:>12}".format(
+        "entities", "refresh s", "matches", "index p50", "index p99", "scan p50", "scan p99"))
+    for size in args.sizes:
+        entities = matcher_benchmark.generate_entities(size)
+        start = time.perf_counter()
+        watchlist.prepare_db()
+        watchlist.apply_watchlist([{'entity': entity, 'entity_type': 'person'} for entity in entities])
+        watchlist.execute_statement("ANALYZE watchlist")
+        refresh = time.perf_counter() - start
+
+        keywords = matcher_benchmark.generate_keywords(entities, args.keywords)
+        indexed = []
+        full_scan = []
+        matches = 0
+        for batch_start in range(0, len(keywords), args.batch_size):
+            batch = keywords[batch_start:batch_start + args.batch_size]
+            statement, parameters = watchlist.get_keywords_query(batch)
+            duration, records = query(statement, batch)
+            indexed.append(duration)
+            matches += len(records)
+            if not args.no_full_scan:
+                duration, full_scan_records = query(FULL_SCAN_QUERY, batch)
+                full_scan.append(duration)
+                assert records == full_scan_records, "different matches for {0}".format(batch)
+        print("{0:>9} {1:>10.1f} {2:>9} {3:>12.1f} {4:>12.1f} {5:>12} {6:>12}".format(
+            size, refresh, matches, percentile(indexed, 0.5) * 1000, percentile(indexed, 0.99) * 1000,
+            "{0:.1f}".format(percentile(full_scan, 0.5) * 1000) if full_scan else "-",
+            "{0:.1f}".format(percentile(full_scan, 0.99) * 1000) if full_scan else "-"))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', required=True, help="libpq connection string of a scratch database")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--keywords', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=10, help="number of keywords per query")
+    parser.add_argument('--no-full-scan', action='store_true', help="skip the full scan query and the parity check")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    run(args)
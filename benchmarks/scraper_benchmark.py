@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+"""
+Benchmark of the html parsing of the scraper - parse time and peak memory of the previous full document parse
+compared with the scraper, which parses only the target html tag, with each available parser
+Usage: python benchmarks/scraper_benchmark.py [--fixtures page1.html page2.html] [--html-tag article]
+       [--html-attribute '{"itemprop": "articleBody"}']
+Without fixtures, pages of 100KB, 1MB and 5MB are generated and saved to a temporary directory
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'serverless'))
+from bs4 import BeautifulSoup
+import scraper
+
+WORDS = ['watchlist', 'newsfeed', 'Skywalker', 'financial', 'droid', 'market', 'report', 'analysis', 'Jedi']
+
+
+def generate_page(size):
+    """
+    Generate a news like page of about size bytes - navigation, side bars and comments around one article
+    """
+    random.seed(size)
+
+    def paragraph():
+        return "<p>{0}</p>".format(" ".join(random.choice(WORDS) for _ in range(60)))
+
+    noise = []
+    length = 0
+    while length < size * 0.9:
+        block = '<div class="comment"><span class="author">{0}</span>{1}<a href="/x">reply</a></div>'.format(
+            random.choice(WORDS), paragraph())
+        noise.append(block)
+        length += len(block)
+    article = '<article itemprop="articleBody">{0}</article>'.format(
+        "".join(paragraph() for _ in range(max(1, size // 10 // 500))))
+    middle = len(noise) // 2
+    return "<html><head><title>news</title></head><body><nav>{0}</nav>{1}{2}</body></html>".format(
+        "".join(noise[:middle]), article, "".join(noise[middle:]))
+
+
+def full_parse(content, html_tag, html_attribute, parser):
+    soup = BeautifulSoup(content, parser)
+    return soup.find(html_tag, html_attribute).text
+
+
+def measure(function, repeat):
+    """
+    :return: the best time in ms and the peak traced memory in MB
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 1024 / 1024
+
+
+def run(fixtures, html_tag, html_attribute, repeat):
+    parsers = ['html.parser']
+    if scraper.get_parser() == 'lxml':
+        parsers.append('lxml')
+    print("{0:<28} {1:>10} {2:<34} {3:>10} {4:>10}".format("fixture", "bytes", "method", "ms", "peak MB"))
+    for fixture in fixtures:
+        with open(fixture, 'rb') as fixture_file:
+            content = fixture_file.read()
+        expected = full_parse(content, html_tag, html_attribute, 'html.parser')
+        methods = [('full parse html.parser (previous)',
+                    lambda: full_parse(content, html_tag, html_attribute, 'html.parser'))]
+        for parser in parsers:
+            methods.append(('target tag only ' + parser,
+                            lambda parser=parser: scraper.extract_text(content, html_tag, html_attribute,
+                                                                       parser=parser)))
+        for name, method in methods:
+            assert method() == expected
+            elapsed, peak = measure(method, repeat)
+            print("{0:<28} {1:>10} {2:<34} {3:>10.1f} {4:>10.1f}".format(
+                os.path.basename(fixture), len(content), name, elapsed, peak))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fixtures', nargs='+')
+    parser.add_argument('--html-tag', default='article')
+    parser.add_argument('--html-attribute', type=json.loads, default={"itemprop": "articleBody"})
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    if args.fixtures:
+        run(args.fixtures, args.html_tag, args.html_attribute, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory(prefix='scraper-fixtures-') as fixtures_dir:
+            fixtures = []
+            for size in [100 * 1024, 1024 * 1024, 5 * 1024 * 1024]:
+                path = os.path.join(fixtures_dir, "page_{0}kb.html".format(size // 1024))
+                with open(path, 'w') as fixture_file:
+                    fixture_file.write(generate_page(size))
+                fixtures.append(path)
+            run(fixtures, args.html_tag, args.html_attribute, args.repeat)
@@ -0,0 +1,587 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import botocore.exceptions
+import common
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+import uuid
+import logging
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+
+# Comprehend real-time APIs text size limit in bytes
+# https://docs.aws.amazon.com/comprehend/latest/dg/API_DetectEntities.html TextSizeLimitExceededException
+COMPREHEND_TEXT_LIMIT = 5000
+SENTIMENT_SCORES = ['Positive', 'Negative', 'Neutral', 'Mixed']
+# Comprehend default quotas in requests per second of each single document API and each batch API
+# https://docs.aws.amazon.com/comprehend/latest/dg/guidelines-and-limits.html
+COMPREHEND_RATE = 20
+COMPREHEND_BATCH_RATE = 10
+COMPREHEND_MAX_RETRIES = 5
+THROTTLING_ERRORS = ['ThrottlingException', 'TooManyRequestsException']
+TRANSIENT_ERRORS = ['InternalServerException', 'ServiceUnavailableException']
+
+# Global rate limiters of the Comprehend APIs, shared by all the threads of the container across warm invocations,
+# and their settings - rate, batch rate, adaptive rate and retries(see configure_rate_limits)
+rate_limiters = {}
+rate_limits = (COMPREHEND_RATE, COMPREHEND_BATCH_RATE, True, COMPREHEND_MAX_RETRIES)
+rate_limiter_lock = threading.Lock()
+
+
+def configure_rate_limits(config):
+    """
+    Configure the rate limiters of the Comprehend APIs - comprehend-rate(default 20) calls per second of each single
+    document API, comprehend-batch-rate(default 10) calls per second of each batch API, 0 for no limit. With
+    comprehend-adaptive-rate(default true) the rates follow the throttling errors, and a throttled call is retried up
+    to comprehend-max-retries times(default 5). The limiters are replaced when the settings change
+    :param config: the configuration dictionary
+    """
+    global rate_limits
+    settings = (float(config.get('comprehend-rate', COMPREHEND_RATE)),
+                float(config.get('comprehend-batch-rate', COMPREHEND_BATCH_RATE)),
+                common.is_enabled(config.get('comprehend-adaptive-rate', True)),
+                int(config.get('comprehend-max-retries', COMPREHEND_MAX_RETRIES)))
+    with rate_limiter_lock:
+        if settings != rate_limits:
+            rate_limits = settings
+            rate_limiters.clear()
+
+
+def get_rate_limiter(api):
+    """
+    Returns the rate limiter of a Comprehend API
+    :param api: the API name, e.g. detect_entities or batch_detect_entities
+    :return: the rate limiter, None when the API calls are not limited
+    """
+    with rate_limiter_lock:
+        if api not in rate_limiters:
+            rate, batch_rate, adaptive, max_retries = rate_limits
+            rate = batch_rate if api.startswith('batch_') else rate
+            rate_limiters[api] = common.RateLimiter(rate, adaptive) if rate > 0 else None
+        return rate_limiters[api]
+
+
+def get_error_code(error):
+    """
+    Returns the code of an error raised by a boto3 client call
+    :param error: the exception
+    :return: the error code, the class name for the connection errors
+    """
+    if isinstance(error, botocore.exceptions.ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return type(error).__name__
+
+
+def call_comprehend(client, api, **request):
+    """
+    Call a Comprehend API within its rate limit, the call waits for a token of the API rate limiter and holds an
+    outbound slot only once it has one. Throttled calls, and calls failing with a server or connection error, are
+    retried after a jittered exponential delay, and a throttling error decreases the rate of the API. The throttles,
+    the time waiting for a token and the time waiting to retry are recorded in the comprehend.throttles,
+    comprehend.rate_limit_wait and comprehend.backoff_wait metrics
+    :param client: boto3 comprehend client instance
+    :param api: the API name, e.g. detect_entities
+    :param request: the request parameters
+    :return: the Comprehend response
+    """
+    limiter = get_rate_limiter(api)
+    max_retries = rate_limits[3]
+    attempt = 0
+    while True:
+        if limiter is not None:
+            waited = limiter.acquire()
+            if waited:
+                common.metrics.add('comprehend.rate_limit_wait', waited * 1000, 'Milliseconds')
+        try:
+            with common.outbound_slot(), common.timed('comprehend.' + api):
+                response = getattr(client, api)(**request)
+        except (botocore.exceptions.ClientError, botocore.exceptions.ConnectionError,
+                botocore.exceptions.HTTPClientError) as e:
+            error_code = get_error_code(e)
+            throttled = error_code in THROTTLING_ERRORS
+            if throttled:
+                common.metrics.add('comprehend.throttles', 1)
+                if limiter is not None:
+                    limiter.throttled()
+            retryable = throttled or error_code in TRANSIENT_ERRORS or \
+                not isinstance(e, botocore.exceptions.ClientError)
+            if attempt >= max_retries or not retryable:
+                raise
+            delay = common.get_backoff_delay(attempt)
+            log.warning("{0} failed with {1}, retrying in {2:.0f} ms".format(api, error_code, delay * 1000))
+            common.metrics.add('comprehend.backoff_wait', delay * 1000, 'Milliseconds')
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if limiter is not None:
+            limiter.succeeded()
+        return response
+
+
+def get_text_chunks(input_text, size=COMPREHEND_TEXT_LIMIT, max_chunks=1):
+    """
+    Split a text to sentence aligned chunks, each chunk is smaller than size bytes once encoded to UTF-8
+    :param input_text: the input text
+    :param size: the chunk size limit in bytes
+    :param max_chunks: the maximal number of chunks, the rest of the text is ignored
+    :return: list of (offset, chunk) tuples, offset is the position of the chunk in the input text
+    """
+    chunks = []
+    offset = 0
+    while offset < len(input_text) and len(chunks) < max_chunks:
+        # a character takes at least one byte, so size characters are enough to fill a chunk
+        chunk = common.limited_text(input_text[offset:offset + size], size)
+        if not chunk:
+            break
+        end = offset + len(chunk)
+        if end < len(input_text):
+            # more text follows, cut at the last sentence end, or else at the last whitespace
+            cut = common.find_text_boundary(chunk + input_text[end], 'sentence') or \
+                common.find_text_boundary(chunk, 'whitespace')
+            if cut > 0:
+                chunk = chunk[:cut]
+        if chunk.strip():
+            chunks.append((offset, chunk))
+        offset += len(chunk)
+    return chunks
+
+
+def analyze_chunks(detect, input_text, max_chunks, max_workers):
+    """
+    Split a text to chunks and call a Comprehend detect function concurrently on each chunk
+    :param detect: function calling Comprehend with a text and returning the Comprehend response
+    :param input_text: the input text
+    :param max_chunks: the maximal number of chunks to analyze
+    :param max_workers: the maximal number of concurrent Comprehend calls
+    :return: list of the chunks and list of the matching Comprehend responses
+    """
+    chunks = get_text_chunks(input_text, COMPREHEND_TEXT_LIMIT, max_chunks)
+    if not chunks:
+        raise ValueError("No text to analyze")
+    log.info("Analyzing {0} chunks".format(len(chunks)))
+    if len(chunks) == 1:
+        return chunks, [detect(chunk) for offset, chunk in chunks]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        responses = list(executor.map(lambda item: detect(item[1]), chunks))
+    return chunks, responses
+
+
+def merge_entities(chunks, responses):
+    """
+    Merge the entities of several chunks, offsets are adjusted to the full text and duplicated entities(same text
+    and type) are kept once with their highest score
+    :param chunks: list of (offset, chunk) tuples
+    :param responses: the Comprehend detect_entities responses of the chunks
+    :return: a detect_entities like response with the merged entities
+    """
+    merged = {}
+    for (offset, chunk), response in zip(chunks, responses):
+        for entity in response['Entities']:
+            entity = adjust_offsets(entity, offset)
+            key = (entity['Text'].lower(), entity['Type'])
+            if key not in merged or entity['Score'] > merged[key]['Score']:
+                merged[key] = entity
+    return {
+        'Entities': sorted(merged.values(), key=lambda entity: entity.get('BeginOffset', 0)),
+        'ChunkCount': len(chunks)
+    }
+
+
+def merge_keyphrases(chunks, responses):
+    """
+    Merge the key phrases of several chunks, offsets are adjusted to the full text and duplicated key phrases are
+    kept once with their highest score
+    :param chunks: list of (offset, chunk) tuples
+    :param responses: the Comprehend detect_key_phrases responses of the chunks
+    :return: a detect_key_phrases like response with the merged key phrases
+    """
+    merged = {}
+    for (offset, chunk), response in zip(chunks, responses):
+        for keyphrase in response['KeyPhrases']:
+            keyphrase = adjust_offsets(keyphrase, offset)
+            key = keyphrase['Text'].lower()
+            if key not in merged or keyphrase['Score'] > merged[key]['Score']:
+                merged[key] = keyphrase
+    return {
+        'KeyPhrases': sorted(merged.values(), key=lambda keyphrase: keyphrase.get('BeginOffset', 0)),
+        'ChunkCount': len(chunks)
+    }
+
+
+def merge_sentiments(chunks, responses):
+    """
+    Merge the sentiment of several chunks, the scores are averaged weighted by the chunk length
+    :param chunks: list of (offset, chunk) tuples
+    :param responses: the Comprehend detect_sentiment responses of the chunks
+    :return: a detect_sentiment like response with the merged sentiment
+    """
+    total_length = sum(len(chunk) for offset, chunk in chunks)
+    scores = dict.fromkeys(SENTIMENT_SCORES, 0.0)
+    for (offset, chunk), response in zip(chunks, responses):
+        for score in SENTIMENT_SCORES:
+            scores[score] += response['SentimentScore'][score] * len(chunk) / total_length
+    return {
+        'Sentiment': max(SENTIMENT_SCORES, key=lambda score: scores[score]).upper(),
+        'SentimentScore': scores,
+        'ChunkCount': len(chunks)
+    }
+
+
+def adjust_offsets(item, offset):
+    """
+    Returns a copy of an entity or key phrase with offsets relative to the full text
+    """
+    item = dict(item)
+    if 'BeginOffset' in item:
+        item['BeginOffset'] += offset
+    if 'EndOffset' in item:
+        item['EndOffset'] += offset
+    return item
+
+
+# Comprehend batch APIs accept up to 25 documents per request
+BATCH_SIZE = 25
+# analysis type: (batch API, single document API, merge function)
+ANALYSIS_APIS = {
+    'entities': ('batch_detect_entities', 'detect_entities', merge_entities),
+    'keyphrases': ('batch_detect_key_phrases', 'detect_key_phrases', merge_keyphrases),
+    'sentiments': ('batch_detect_sentiment', 'detect_sentiment', merge_sentiments)
+}
+
+
+def get_documents(input_text, max_chunks):
+    """
+    Returns the documents to analyze for a text - the text start when max_chunks is 1, else the text chunks
+    :param input_text: the input text
+    :param max_chunks: the maximal number of chunks to analyze
+    :return: list of (offset, chunk) tuples, empty when the text holds no text to analyze
+    """
+    if max_chunks > 1:
+        return get_text_chunks(input_text, COMPREHEND_TEXT_LIMIT, max_chunks)
+    text_start = common.limited_text(input_text, COMPREHEND_TEXT_LIMIT)
+    # an empty document fails the validation of the whole batch request
+    if not text_start.strip():
+        return []
+    return [(0, text_start)]
+
+
+def batch_analyze(client, analysis_type, texts, max_chunks=1):
+    """
+    Analyze several texts with the Comprehend batch APIs, the documents(texts or text chunks) of all the texts are
+    sent in requests of up to 25 documents. A document reported in the ErrorList, or a document of a failed batch
+    request, is retried with the single document API
+    :param client: boto3 comprehend client instance
+    :param analysis_type: entities/keyphrases/sentiments
+    :param texts: dictionary of key to the text to analyze
+    :param max_chunks: the maximal number of chunks to analyze per text
+    :return: dictionary of key to the Comprehend response of the text, or to the exception raised analyzing it
+    """
+    batch_api, single_api, merge = ANALYSIS_APIS[analysis_type]
+    documents = []
+    for key, text in texts.items():
+        documents.extend((key, offset, chunk) for offset, chunk in get_documents(text, max_chunks))
+
+    responses = [None] * len(documents)
+    for start in range(0, len(documents), BATCH_SIZE):
+        batch = documents[start:start + BATCH_SIZE]
+        try:
+            response = call_comprehend(client, batch_api, TextList=[chunk for key, offset, chunk in batch],
+                                       LanguageCode='en')
+        except Exception:
+            log.error("Error executing {0}, retrying the {1} documents one by one".format(batch_api, len(batch)),
+                      exc_info=True)
+            response = {'ResultList': [], 'ErrorList': [{'Index': index} for index in range(len(batch))]}
+        for result in response['ResultList']:
+            responses[start + result['Index']] = {k: v for k, v in result.items() if k != 'Index'}
+        for error in response['ErrorList']:
+            key, offset, chunk = batch[error['Index']]
+            if 'ErrorCode' in error:
+                log.warning("{0} failed for {1} with {2}, retrying the document".format(
+                    batch_api, key, error['ErrorCode']))
+            try:
+                responses[start + error['Index']] = call_comprehend(client, single_api, Text=chunk, LanguageCode='en')
+            except Exception as e:
+                responses[start + error['Index']] = e
+    log.info("Analyzed {0} {1} documents in {2} requests".format(
+        len(documents), analysis_type, (len(documents) + BATCH_SIZE - 1) // BATCH_SIZE))
+
+    text_chunks = {key: [] for key in texts}
+    text_responses = {key: [] for key in texts}
+    for (key, offset, chunk), response in zip(documents, responses):
+        text_chunks[key].append((offset, chunk))
+        text_responses[key].append(response)
+    results = {}
+    for key in texts:
+        errors = [response for response in text_responses[key] if isinstance(response, Exception)]
+        if errors:
+            results[key] = errors[0]
+        elif not text_chunks[key]:
+            results[key] = ValueError("No text to analyze")
+        elif max_chunks > 1:
+            results[key] = merge(text_chunks[key], text_responses[key])
+        else:
+            results[key] = text_responses[key][0]
+    return results
+
+
+class AnalysisCache:
+    """
+    Two tiers cache of Comprehend results keyed by analysis type and content hash - an in-container LRU bounded by
+    the size of the cached results, and optionally a persistent S3 prefix shared by all the containers
+    """
+
+    def __init__(self, max_bytes, bucket=None, prefix='comprehend-cache'):
+        """
+        :param max_bytes: the maximal size of the in-container cache, least recently used results are evicted first
+        :param bucket: the bucket of the persistent tier, None to use only the in-container tier
+        :param prefix: the prefix of the persistent tier within the bucket
+        """
+        self.max_bytes = max_bytes
+        self.bucket = bucket
+        self.prefix = prefix
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = dict.fromkeys(['memory_hits', 's3_hits', 'misses', 'evictions'], 0)
+
+    @staticmethod
+    def get_content_hash(input_text, max_chunks):
+        """
+        Hash the part of the text that is analyzed, the number of chunks is part of the hash as it changes the result
+        :param input_text: the input text
+        :param max_chunks: the maximal number of chunks analyzed
+        :return: the content hash
+        """
+        analyzed_text = common.limited_text(input_text, COMPREHEND_TEXT_LIMIT * max(max_chunks, 1))
+        return "{0}-{1}".format(hashlib.sha256(analyzed_text.encode('utf-8')).hexdigest(), max(max_chunks, 1))
+
+    def get(self, analysis_type, content_hash):
+        """
+        Get a cached result
+        :param analysis_type: entities/keyphrases/sentiments
+        :param content_hash: the content hash
+        :return: the cached Comprehend result, None on a cache miss
+        """
+        key = analysis_type + '/' + content_hash
+        with self.lock:
+            serialized = self.entries.get(key)
+            if serialized is not None:
+                self.entries.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return json.loads(serialized)
+        if self.bucket is not None:
+            s3 = common.get_client('s3')
+            try:
+                with common.outbound_slot(), common.timed('s3.get_object'):
+                    serialized = s3.get_object(Bucket=self.bucket,
+                                               Key=self.prefix + '/' + key + '.json')['Body'].read()
+            except s3.exceptions.NoSuchKey:
+                serialized = None
+            except Exception:
+                log.warning("Error reading cached result {0}".format(key), exc_info=True)
+                serialized = None
+            if serialized is not None:
+                serialized = serialized.decode('utf-8')
+                self.add_entry(key, serialized)
+                with self.lock:
+                    self.stats['s3_hits'] += 1
+                return json.loads(serialized)
+        with self.lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, analysis_type, content_hash, result):
+        """
+        Cache a result in both tiers
+        :param analysis_type: entities/keyphrases/sentiments
+        :param content_hash: the content hash
+        :param result: the Comprehend result
+        """
+        key = analysis_type + '/' + content_hash
+        serialized = json.dumps(result)
+        self.add_entry(key, serialized)
+        if self.bucket is not None:
+            common.save_content_to_bucket(self.bucket, self.prefix + '/' + analysis_type, content_hash, ".json",
+                                          serialized)
+
+    def add_entry(self, key, serialized):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            if len(serialized) > self.max_bytes:
+                return
+            self.entries[key] = serialized
+            self.size += len(serialized)
+            while self.size > self.max_bytes:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def log_stats(self):
+        log.info("Comprehend cache stats {0}, {1} entries, {2} bytes".format(
+            json.dumps(self.stats), len(self.entries), self.size))
+
+
+# Global variable for the Comprehend results cache, kept across warm invocations
+analysis_cache = None
+
+
+def get_analysis_cache(config):
+    """
+    Returns the Comprehend results cache configured by comprehend-cache
+    none - no cache(default), memory - in-container cache only, s3 - in-container cache and the newsfeed bucket
+    :param config: the configuration dictionary
+    :return: the cache, None when disabled
+    """
+    global analysis_cache
+    cache_mode = config.get('comprehend-cache', 'none')
+    if cache_mode == 'none':
+        return None
+    bucket = config['newsfeed-bucket'] if cache_mode == 's3' else None
+    max_bytes = int(config.get('comprehend-cache-max-bytes', 64 * 1024 * 1024))
+    if analysis_cache is None or analysis_cache.bucket != bucket or analysis_cache.max_bytes != max_bytes:
+        analysis_cache = AnalysisCache(max_bytes, bucket)
+    return analysis_cache
+
+
+# File suffix of the per batch analysis output formats, json writes the Comprehend responses of each message
+ANALYSIS_OUTPUT_SUFFIXES = {
+    'jsonl': '.jsonl.gz',
+    'parquet': '.parquet'
+}
+
+
+def get_compact_analysis(message_id, url, analyses):
+    """
+    Returns the fields of interest of the analyses of a message - entity text/type/score/offsets, key phrases and
+    sentiment scores, without the Comprehend response metadata
+    :param message_id: the SQS message id
+    :param url: the url of the newsfeed
+    :param analyses: dictionary of analysis type(entities/keyphrases/sentiments) to the Comprehend response
+    :return: the analysis record
+    """
+    record = {'message_id': message_id, 'url': url, 'entities': None, 'keyphrases': None, 'sentiment': None,
+              'sentiment_score': None}
+    if 'entities' in analyses:
+        record['entities'] = [{
+            'text': entity['Text'],
+            'type': entity['Type'],
+            'score': entity['Score'],
+            'begin_offset': entity.get('BeginOffset'),
+            'end_offset': entity.get('EndOffset')
+        } for entity in analyses['entities']['Entities']]
+    if 'keyphrases' in analyses:
+        record['keyphrases'] = [{
+            'text': keyphrase['Text'],
+            'score': keyphrase['Score'],
+            'begin_offset': keyphrase.get('BeginOffset'),
+            'end_offset': keyphrase.get('EndOffset')
+        } for keyphrase in analyses['keyphrases']['KeyPhrases']]
+    if 'sentiments' in analyses:
+        record['sentiment'] = analyses['sentiments']['Sentiment']
+        record['sentiment_score'] = {score.lower(): analyses['sentiments']['SentimentScore'][score]
+                                     for score in SENTIMENT_SCORES}
+    return record
+
+
+class AnalysisOutputBuffer:
+    """
+    Buffer of the analyses of an SQS batch, written as a single JSONL.gz or Parquet file partitioned by date -
+    analysis/dt=YYYY-MM-DD/<batch id>.jsonl.gz - in place of one object per message and analysis type
+    """
+
+    def __init__(self, output_format, bucket, prefix='analysis'):
+        """
+        :param output_format: jsonl or parquet, parquet requires the pyarrow package
+        :param bucket: the bucket of the output files
+        :param prefix: the prefix of the output files within the bucket
+        """
+        if output_format not in ANALYSIS_OUTPUT_SUFFIXES:
+            raise ValueError("Unknown analysis-output-format {0}".format(output_format))
+        self.output_format = output_format
+        self.bucket = bucket
+        self.prefix = prefix
+        self.records = []
+        self.lock = threading.Lock()
+
+    def add(self, message_id, url, analyses):
+        """
+        Buffer the analyses of a message
+        :param message_id: the SQS message id
+        :param url: the url of the newsfeed
+        :param analyses: dictionary of analysis type(entities/keyphrases/sentiments) to the Comprehend response
+        """
+        record = get_compact_analysis(message_id, url, analyses)
+        with self.lock:
+            self.records.append(record)
+
+    def flush(self, batch_id=None):
+        """
+        Write the buffered analyses to the bucket
+        :param batch_id: the name of the output file, default is a random id
+        :return: the key of the written file, None when there was nothing to write or the write failed
+        """
+        with self.lock:
+            records = self.records
+            self.records = []
+        if not records:
+            return None
+        if self.output_format == 'parquet':
+            content = serialize_parquet(records)
+        else:
+            content = gzip.compress("".join(json.dumps(record) + "\n" for record in records).encode('utf-8'))
+        sub_dir = "{0}/dt={1}".format(self.prefix, datetime.utcnow().strftime("%Y-%m-%d"))
+        file_name = batch_id or uuid.uuid4().hex
+        suffix = ANALYSIS_OUTPUT_SUFFIXES[self.output_format]
+        log.info("Writing {0} analyses, {1} bytes".format(len(records), len(content)))
+        if not common.save_content_to_bucket(self.bucket, sub_dir, file_name, suffix, content):
+            return None
+        return sub_dir + '/' + file_name + suffix
+
+
+def serialize_parquet(records):
+    """
+    Serialize analysis records to a Parquet file, pyarrow is only imported when the parquet format is used
+    :param records: the analysis records, see get_compact_analysis
+    :return: the Parquet file bytes
+    """
+    import pyarrow
+    import pyarrow.parquet
+    offsets = [('begin_offset', pyarrow.int64()), ('end_offset', pyarrow.int64())]
+    schema = pyarrow.schema([
+        ('message_id', pyarrow.string()),
+        ('url', pyarrow.string()),
+        ('entities', pyarrow.list_(pyarrow.struct(
+            [('text', pyarrow.string()), ('type', pyarrow.string()), ('score', pyarrow.float64())] + offsets))),
+        ('keyphrases', pyarrow.list_(pyarrow.struct(
+            [('text', pyarrow.string()), ('score', pyarrow.float64())] + offsets))),
+        ('sentiment', pyarrow.string()),
+        ('sentiment_score', pyarrow.struct([(score.lower(), pyarrow.float64()) for score in SENTIMENT_SCORES]))
+    ])
+    table = pyarrow.Table.from_pydict({field.name: [record[field.name] for record in records] for field in schema},
+                                      schema=schema)
+    output = io.BytesIO()
+    pyarrow.parquet.write_table(table, output, compression='snappy')
+    return output.getvalue()
+
+
+def get_analysis_output(config):
+    """
+    Returns the per batch analysis output configured by analysis-output-format
+    json - one object per message and analysis type(default), jsonl - one JSONL.gz file per batch, parquet - one
+    Parquet file per batch
+    :param config: the configuration dictionary
+    :return: the output buffer, None for the json format
+    """
+    output_format = config.get('analysis-output-format', 'json')
+    if output_format == 'json':
+        return None
+    return AnalysisOutputBuffer(output_format, config['newsfeed-bucket'])
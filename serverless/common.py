@@ -2,13 +2,52 @@
 # SPDX-License-Identifier: MIT-0
 
 import boto3
+import base64
+import contextlib
+import functools
+import gzip
 import json
+import os
+import random
+import re
+import sys
+import threading
+import time
 from datetime import datetime
+import botocore.config
 import botocore.exceptions
 import logging
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
+# Global caches for the configuration and the boto3 clients, kept across warm invocations
+config_cache = {}
+clients = {}
+queue_urls = {}
+cache_lock = threading.Lock()
+
+# Bound of the concurrent outbound calls(AWS APIs and the DB) of a container, shared by all the threads and sized
+# by the max-concurrency configuration key. The boto3 clients get as many pooled HTTP connections
+MAX_CONCURRENCY = 10
+max_concurrency = MAX_CONCURRENCY
+outbound_semaphore = threading.BoundedSemaphore(MAX_CONCURRENCY)
+# Retries of the boto3 clients per service, the Comprehend calls are retried by analysis.call_comprehend which
+# adapts the rate of the calls to the throttling errors
+CLIENT_RETRIES = {'comprehend': {'max_attempts': 0}}
+
+# CloudWatch namespace of the metrics of the handlers, EMF accepts up to 100 values per metric
+METRICS_NAMESPACE = 'NewsfeedRealtimeAnalysis'
+EMF_MAX_VALUES = 100
+
+# File suffixes of the supported content compressions
+CONTENT_ENCODING_SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst'
+}
+
+# End of a sentence - punctuation, optional closing quotes or brackets, then a whitespace
+SENTENCE_END = re.compile(r'[.!?]["\'\)\]]*\s')
+
 
 def save_content_to_bucket(bucket, sub_dir, filename, suffix, content, content_type="TEXT"):
     """
@@ -22,36 +61,104 @@ def save_content_to_bucket(bucket, sub_dir, filename, suffix, content, content_t
     :return: True
     """
     try:
-        s3 = boto3.resource('s3')
+        s3 = get_client('s3')
         filepath = sub_dir + '/' + filename + suffix
         log.info("Writing file {0}".format(filepath))
 
-        if content_type == "TEXT":
-            s3.Object(bucket, filepath).put(Body=content)
-        else:
-            s3.Object(bucket, filepath).put(Body=json.dumps(content))
+        if content_type != "TEXT":
+            content = json.dumps(content)
+        with outbound_slot(), timed('s3.put_object'):
+            s3.put_object(Bucket=bucket, Key=filepath, Body=content)
+        metrics.add('s3.put_object.bytes', len(content.encode('utf-8') if isinstance(content, str) else content),
+                    'Bytes')
     except Exception as e:
         log.error("Exception in save_content_to_bucket", e)
         return False
     return True
 
 
-def limited_text(input_text, size):
+def compress_content(content, encoding):
     """
-    limited text, the function checks if the input text exceeds 5000 bytes, and if so, returns the first 5000 characters.
+    Compress a content
+    :param content: the content bytes
+    :param encoding: gzip, or zstd which requires the zstandard package
+    :return: the compressed bytes
     """
-    result = ""
-    if len(input_text.encode('utf-8')) > size:
-        for i in input_text:
-            if len((result + i).encode('utf-8')) < size:
-                result = result + i
-        log.info(len(result))
-    else:
-        result = input_text
-    log.info(len(result.encode('utf-8')))
+    if encoding == 'gzip':
+        return gzip.compress(content)
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().compress(content)
+    raise ValueError("Unknown content encoding {0}".format(encoding))
+
+
+def decompress_content(content, encoding):
+    """
+    Decompress a content compressed by compress_content
+    :param content: the compressed bytes
+    :param encoding: gzip/zstd
+    :return: the content bytes
+    """
+    if encoding == 'gzip':
+        return gzip.decompress(content)
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(content)
+    raise ValueError("Unknown content encoding {0}".format(encoding))
+
+
+def is_enabled(value):
+    """
+    Check a configuration flag, the flag can be a boolean or a "true"/"false" string
+    :param value: the configuration value
+    :return: True when the flag is enabled
+    """
+    return value is True or str(value).lower() == "true"
+
+
+def limited_text(input_text, size, boundary=None):
+    """
+    limited text, the function checks if the input text exceeds size bytes once encoded to UTF-8, and if so, returns
+    the longest prefix of the text which is smaller than size bytes, cut at a complete character.
+    :param input_text: the input text
+    :param size: the size limit in bytes
+    :param boundary: None to cut at the last complete character, 'whitespace' to cut at the last whitespace or
+    'sentence' to cut at the last sentence end, falls back to the last complete character when none is found
+    :return: the limited text
+    """
+    encoded = input_text.encode('utf-8')
+    if len(encoded) <= size:
+        return input_text
+    # cutting the bytes may split a multi-byte character, the partial character is dropped by the decoder
+    result = encoded[:max(size - 1, 0)].decode('utf-8', 'ignore')
+    if boundary is not None:
+        cut = find_text_boundary(result, boundary)
+        if cut > 0:
+            result = result[:cut]
+    log.info("Limited text from {0} to {1} characters".format(len(input_text), len(result)))
     return result
 
 
+def find_text_boundary(text, boundary):
+    """
+    Find the position after the last boundary of the text
+    :param text: the text to search
+    :param boundary: 'whitespace' or 'sentence'
+    :return: the position to cut the text at, 0 when there is no boundary
+    """
+    if boundary == 'sentence':
+        position = 0
+        for sentence_end in SENTENCE_END.finditer(text):
+            position = sentence_end.end() - 1
+        return position
+    if boundary == 'whitespace':
+        for position in range(len(text) - 1, -1, -1):
+            if text[position].isspace():
+                return position
+        return 0
+    raise ValueError("Unknown text boundary {0}".format(boundary))
+
+
 def get_secret(secret_name):
     """
         Get the secret dictionary - key/value
@@ -60,16 +167,8 @@ def get_secret(secret_name):
     """
     region_name = "us-east-2"
     secret = None
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    # print("before secret")
-    # endpoint_url = "https://secretsmanager.us-east-2.amazonaws.com"
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-        # endpoint_url=endpoint_url
-    )
-    # endpoint_url='https://secretsmanager.us-west-2.amazonaws.com'
+    # Get the shared Secrets Manager client
+    client = get_client('secretsmanager', region_name)
 
     try:
         get_secret_value_response = client.get_secret_value(
@@ -104,6 +203,327 @@ def get_secret(secret_name):
         if 'SecretString' in get_secret_value_response:
             secret = get_secret_value_response['SecretString']
         else:
-            decoded_binary_secret = base64.b64decode(get_secret_value_response['SecretBinary'])
+            secret = base64.b64decode(get_secret_value_response['SecretBinary'])
     # print("after secret")
     return json.loads(secret)  # returns the secret as dictionary
+
+
+def get_config(secret_name=None):
+    """
+    Get the configuration dictionary, cached across invocations of the same container
+    The cached configuration expires after config-cache-ttl seconds (default 300)
+    :param secret_name: the name of the secret, default is the SECRET environment variable
+    :return: the configuration dictionary
+    """
+    if secret_name is None:
+        secret_name = os.environ['SECRET']
+    cached = config_cache.get(secret_name)
+    if cached is not None and time.time() < cached[1]:
+        return cached[0]
+    config = get_secret(secret_name)
+    expiry = time.time() + float(config.get('config-cache-ttl', 300))
+    with cache_lock:
+        config_cache[secret_name] = (config, expiry)
+    configure_concurrency(config)
+    return config
+
+
+def configure_concurrency(config):
+    """
+    Size the shared bound of the concurrent outbound calls with max-concurrency (default 10), clients created
+    afterwards get a connection pool of the same size
+    :param config: the configuration dictionary
+    :return: the maximal number of concurrent outbound calls
+    """
+    global max_concurrency, outbound_semaphore
+    size = max(1, int(config.get('max-concurrency', MAX_CONCURRENCY)))
+    with cache_lock:
+        if size != max_concurrency:
+            max_concurrency = size
+            outbound_semaphore = threading.BoundedSemaphore(size)
+    return size
+
+
+def outbound_slot():
+    """
+    Returns the context manager holding one of the shared outbound call slots, to wrap each single AWS API or DB
+    call - whatever thread pool runs it, at most max-concurrency calls are in flight in the container
+    A slot must not be held while waiting on another call, or the nested call could wait forever for a slot
+    :return: the context manager
+    """
+    return outbound_semaphore
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the rate of the calls to an API, shared by all the threads of the container. The bucket
+    holds up to a second of calls, a call takes a token or waits until its token is refilled
+    When adaptive, the rate follows the throttling of the API - it is halved on a throttling error(at most once per
+    second, the concurrent calls throttled together count once) and grows back by about one call per second every
+    second of successful calls, up to the configured rate
+    """
+
+    def __init__(self, rate, adaptive=True, min_rate=0.5):
+        """
+        :param rate: the maximal number of calls per second
+        :param adaptive: True to adapt the rate to the throttling errors
+        :param min_rate: the rate is never decreased below min_rate calls per second
+        """
+        self.lock = threading.Lock()
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.adaptive = adaptive
+        self.min_rate = min(min_rate, self.max_rate)
+        self.tokens = max(1.0, self.rate)
+        self.updated = time.monotonic()
+        self.decreased = None
+
+    def acquire(self):
+        """
+        Take a token, waiting for it when the bucket is empty. The token is reserved before waiting, so the waiting
+        calls are served in order
+        :return: the waited time in seconds
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate) - 1
+            self.updated = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self):
+        """
+        Record a throttling error of the API, the rate is halved and the bucket emptied
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.adaptive and (self.decreased is None or now - self.decreased >= 1.0):
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = min(self.tokens, 0.0)
+                self.decreased = now
+
+    def succeeded(self):
+        """
+        Record a successful call of the API, the rate is increased by 1/rate
+        """
+        if not self.adaptive or self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+
+
+def get_backoff_delay(attempt, base=0.1, cap=5.0):
+    """
+    Returns the delay before retrying a throttled call - a random delay up to an exponential bound(full jitter), so
+    the calls throttled together do not retry together
+    :param attempt: the number of the retry, from 0
+    :param base: the bound of the first retry in seconds
+    :param cap: the maximal bound in seconds
+    :return: the delay in seconds
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Metrics:
+    """
+    Metrics of a handler invocation - the durations and call counts of the timed operations, and summed values such
+    as the bytes sent. The operations of all the threads of the invocation are recorded together
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.values = {}
+
+    def reset(self):
+        with self.lock:
+            self.durations = {}
+            self.values = {}
+
+    def add_duration(self, name, milliseconds, failed=False):
+        """
+        Record a timed operation, the first EMF_MAX_VALUES durations are kept and the others are only summed
+        :param name: the operation name
+        :param milliseconds: the duration in milliseconds
+        :param failed: True when the operation raised an exception
+        """
+        with self.lock:
+            duration = self.durations.get(name)
+            if duration is None:
+                duration = self.durations[name] = {'values': [], 'count': 0, 'total': 0.0, 'errors': 0}
+            if len(duration['values']) < EMF_MAX_VALUES:
+                duration['values'].append(round(milliseconds, 3))
+            duration['count'] += 1
+            duration['total'] += milliseconds
+            duration['errors'] += failed
+
+    def add(self, name, value, unit='Count'):
+        """
+        Add a value to a summed metric
+        :param name: the metric name
+        :param value: the value to add
+        :param unit: the CloudWatch unit - Count/Bytes/Milliseconds
+        """
+        with self.lock:
+            if name in self.values:
+                self.values[name][0] += value
+            else:
+                self.values[name] = [value, unit]
+
+    def get_document(self, function_name, properties=None):
+        """
+        Returns the CloudWatch Embedded Metric Format document of the metrics, dimensioned by function name
+        Each timed operation gives <name>.duration(the durations), <name>.count and <name>.errors
+        :param function_name: the handler name
+        :param properties: values logged with the metrics without being metrics, such as the request id
+        :return: the EMF document
+        """
+        document = dict(properties or {}, function=function_name)
+        definitions = []
+        with self.lock:
+            for name, duration in self.durations.items():
+                document[name + '.duration'] = duration['values']
+                document[name + '.count'] = duration['count']
+                document[name + '.errors'] = duration['errors']
+                definitions += [{'Name': name + '.duration', 'Unit': 'Milliseconds'},
+                                {'Name': name + '.count', 'Unit': 'Count'},
+                                {'Name': name + '.errors', 'Unit': 'Count'}]
+            for name, (value, unit) in self.values.items():
+                document[name] = value
+                definitions.append({'Name': name, 'Unit': unit})
+        document['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            # a metric directive holds up to 100 metrics
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['function']],
+                'Metrics': definitions[start:start + 100]
+            } for start in range(0, len(definitions), 100)]
+        }
+        return document
+
+
+class StdoutMetricsSink:
+    """
+    Writes each EMF document as one line on the standard output, extracted to metrics by CloudWatch Logs
+    """
+
+    def write(self, document):
+        sys.stdout.write(json.dumps(document) + "\n")
+        sys.stdout.flush()
+
+
+class MemoryMetricsSink:
+    """
+    Keeps the EMF documents in memory, for tests and benchmarks
+    """
+
+    def __init__(self):
+        self.documents = []
+
+    def write(self, document):
+        self.documents.append(document)
+
+
+# Global metrics of the running invocation, and the sink the metrics are flushed to, None to drop them
+metrics = Metrics()
+metrics_sink = StdoutMetricsSink()
+
+
+@contextlib.contextmanager
+def timed(name):
+    """
+    Record the duration of the wrapped operation in the invocation metrics, as a context manager or a decorator
+    Wrapped inside outbound_slot, the duration does not include the wait for a slot
+    :param name: the operation name, such as s3.put_object
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        metrics.add_duration(name, (time.perf_counter() - start) * 1000, failed)
+
+
+def metered(handler):
+    """
+    Decorator of a Lambda handler, the metrics are reset at the start of the invocation and flushed to the metrics
+    sink at its end, the handler duration is recorded as handler.duration
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        metrics.reset()
+        try:
+            with timed('handler'):
+                return handler(event, context)
+        finally:
+            flush_metrics(handler.__name__, context)
+    return wrapper
+
+
+def flush_metrics(function_name, context=None):
+    """
+    Write the invocation metrics to the metrics sink and reset them, errors are logged and never raised
+    :param function_name: the handler name
+    :param context: the Lambda context, for the request id
+    """
+    try:
+        if metrics_sink is not None:
+            properties = {}
+            if getattr(context, 'aws_request_id', None) is not None:
+                properties['request_id'] = context.aws_request_id
+            metrics_sink.write(metrics.get_document(function_name, properties))
+    except Exception:
+        log.error("Error flushing the metrics", exc_info=True)
+    metrics.reset()
+
+
+def invalidate_config(secret_name=None):
+    """
+    Drop the cached configuration, the next get_config call fetches the secret again
+    :param secret_name: the name of the secret to drop, default is all the cached secrets
+    :return:
+    """
+    with cache_lock:
+        if secret_name is None:
+            config_cache.clear()
+        else:
+            config_cache.pop(secret_name, None)
+
+
+def get_client(service_name, region_name=None):
+    """
+    Get a boto3 client, clients are created once and shared across invocations of the same container
+    :param service_name: the AWS service name - s3/sqs/sns/comprehend/rds-data/secretsmanager
+    :param region_name: the region of the client, default is the Lambda region
+    :return: the boto3 client
+    """
+    key = (service_name, region_name, max_concurrency)
+    client = clients.get(key)
+    if client is None:
+        with cache_lock:
+            client = clients.get(key)
+            if client is None:
+                client = boto3.client(service_name, region_name=region_name,
+                                      config=botocore.config.Config(max_pool_connections=max_concurrency,
+                                                                    retries=CLIENT_RETRIES.get(service_name)))
+                clients[key] = client
+    return client
+
+
+def get_queue_url(queue_name):
+    """
+    Get the url of an SQS queue, cached across invocations of the same container
+    :param queue_name: the queue name
+    :return: the queue url
+    """
+    queue_url = queue_urls.get(queue_name)
+    if queue_url is None:
+        queue_url = get_client('sqs').get_queue_url(QueueName=queue_name)['QueueUrl']
+        queue_urls[queue_name] = queue_url
+    return queue_url
@@ -0,0 +1,276 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from datetime import date, datetime
+import common
+import queue
+import re
+import threading
+import uuid
+import logging
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+
+# A Data API named parameter - :name, not a :: cast
+NAMED_PARAMETER = re.compile(r"(?<![:\w]):(\w+)")
+# Statements prepared by the Postgres backend, the queries run again and again with other parameters
+PREPARED_STATEMENTS = re.compile(r"^\s*(SELECT|WITH)\b", re.I)
+
+
+class DataApiBackend:
+    """
+    Runs the statements through the RDS Data API
+    """
+
+    def __init__(self, secret_arn, cluster_arn, database='postgres'):
+        """
+        :param secret_arn: the ARN of the secret of the DB credentials
+        :param cluster_arn: the ARN of the Aurora serverless cluster
+        :param database: the database name
+        """
+        self.secret_arn = secret_arn
+        self.cluster_arn = cluster_arn
+        self.database = database
+
+    def execute_statement(self, sql, sql_parameters=None, transaction_id=None):
+        request = {
+            'secretArn': self.secret_arn,
+            'database': self.database,
+            'resourceArn': self.cluster_arn,
+            'sql': sql
+        }
+        if sql_parameters:
+            request['parameters'] = sql_parameters
+        if transaction_id:
+            request['transactionId'] = transaction_id
+        return common.get_client('rds-data').execute_statement(**request)
+
+    def batch_execute_statement(self, sql, sql_parameter_sets, transaction_id=None):
+        request = {
+            'secretArn': self.secret_arn,
+            'database': self.database,
+            'resourceArn': self.cluster_arn,
+            'sql': sql,
+            'parameterSets': sql_parameter_sets
+        }
+        if transaction_id:
+            request['transactionId'] = transaction_id
+        return common.get_client('rds-data').batch_execute_statement(**request)
+
+    def begin_transaction(self):
+        return common.get_client('rds-data').begin_transaction(
+            secretArn=self.secret_arn,
+            database=self.database,
+            resourceArn=self.cluster_arn
+        )
+
+    def commit_transaction(self, transaction_id):
+        return common.get_client('rds-data').commit_transaction(
+            secretArn=self.secret_arn,
+            resourceArn=self.cluster_arn,
+            transactionId=transaction_id
+        )
+
+    def rollback_transaction(self, transaction_id):
+        return common.get_client('rds-data').rollback_transaction(
+            secretArn=self.secret_arn,
+            resourceArn=self.cluster_arn,
+            transactionId=transaction_id
+        )
+
+
+class PostgresBackend:
+    """
+    Runs the statements on direct connections to the database with psycopg 3, kept across warm invocations. The
+    SELECT statements are prepared on each connection, batches are sent with executemany(pipelined by psycopg), and
+    the responses have the Data API format - records of stringValue/longValue/doubleValue/booleanValue/isNull fields
+    and numberOfRecordsUpdated
+    The Data API :name parameters are converted to psycopg parameters, the statements must not hold a colon or a
+    percent sign in a string literal other than the LIKE wildcards
+    """
+
+    def __init__(self, dsn, pool_size=1):
+        """
+        :param dsn: the libpq connection string of the database
+        :param pool_size: the maximal number of connections, connections are opened when needed
+        """
+        self.dsn = dsn
+        self.pool_size = max(1, pool_size)
+        self.pool = queue.LifoQueue()
+        self.connections = 0
+        self.lock = threading.Lock()
+        # transaction id -> the connection running the transaction
+        self.transactions = {}
+
+    def connect(self):
+        import psycopg
+        from psycopg.types.string import StrDumper
+        log.info("Connecting to the database")
+        connection = psycopg.connect(self.dsn, autocommit=True)
+        # strings are sent as text like the Data API stringValue, a parameter used both in lower(:entity) and as a
+        # varchar column value would otherwise get inconsistent types
+        connection.adapters.register_dumper(str, StrDumper)
+        return connection
+
+    def acquire(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            opened = self.connections < self.pool_size
+            if opened:
+                self.connections += 1
+        if not opened:
+            return self.pool.get()
+        try:
+            return self.connect()
+        except Exception:
+            with self.lock:
+                self.connections -= 1
+            raise
+
+    def release(self, connection):
+        if connection.closed or connection.broken:
+            # a broken connection is replaced by the next acquire
+            with self.lock:
+                self.connections -= 1
+            return
+        self.pool.put(connection)
+
+    def run(self, transaction_id, function):
+        if transaction_id:
+            return function(self.transactions[transaction_id])
+        connection = self.acquire()
+        try:
+            return function(connection)
+        finally:
+            self.release(connection)
+
+    @staticmethod
+    def get_query(sql, sql_parameters):
+        """
+        Convert a Data API statement and its parameters to a psycopg query and parameters
+        """
+        if not sql_parameters:
+            return sql, None
+        return NAMED_PARAMETER.sub(r"%(\1)s", sql.replace('%', '%%')), get_parameter_values(sql_parameters)
+
+    def execute_statement(self, sql, sql_parameters=None, transaction_id=None):
+        query, values = self.get_query(sql, sql_parameters)
+
+        def execute(connection):
+            with connection.cursor() as cursor:
+                cursor.execute(query, values, prepare=bool(PREPARED_STATEMENTS.match(sql)) or None)
+                return get_response(cursor)
+        return self.run(transaction_id, execute)
+
+    def batch_execute_statement(self, sql, sql_parameter_sets, transaction_id=None):
+        query, values = self.get_query(sql, sql_parameter_sets[0] if sql_parameter_sets else None)
+
+        def execute(connection):
+            with connection.cursor() as cursor:
+                cursor.executemany(query, [get_parameter_values(parameters) for parameters in sql_parameter_sets])
+            return {'updateResults': [{'generatedFields': []} for _ in sql_parameter_sets]}
+        return self.run(transaction_id, execute)
+
+    def begin_transaction(self):
+        connection = self.acquire()
+        try:
+            connection.execute("BEGIN")
+        except Exception:
+            self.release(connection)
+            raise
+        transaction_id = uuid.uuid4().hex
+        self.transactions[transaction_id] = connection
+        return {'transactionId': transaction_id}
+
+    def commit_transaction(self, transaction_id):
+        connection = self.transactions.pop(transaction_id)
+        try:
+            connection.execute("COMMIT")
+        finally:
+            self.release(connection)
+        return {'transactionStatus': 'Transaction Committed'}
+
+    def rollback_transaction(self, transaction_id):
+        connection = self.transactions.pop(transaction_id)
+        try:
+            connection.execute("ROLLBACK")
+        finally:
+            self.release(connection)
+        return {'transactionStatus': 'Rollback Complete'}
+
+
+def get_parameter_values(sql_parameters):
+    """
+    Returns the values of Data API parameters by name
+    :param sql_parameters: list of the Data API parameters - name and value
+    :return: dictionary of the parameter values
+    """
+    values = {}
+    for parameter in sql_parameters:
+        value = parameter['value']
+        values[parameter['name']] = None if value.get('isNull') else next(iter(value.values()))
+    return values
+
+
+def get_field(value):
+    """
+    Returns the Data API field of a column value, timestamps and numerics are strings as in the Data API
+    :param value: the column value
+    :return: the field
+    """
+    if value is None:
+        return {'isNull': True}
+    if isinstance(value, bool):
+        return {'booleanValue': value}
+    if isinstance(value, int):
+        return {'longValue': value}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (bytes, memoryview)):
+        return {'blobValue': bytes(value)}
+    if isinstance(value, (datetime, date)):
+        return {'stringValue': value.isoformat(' ') if isinstance(value, datetime) else value.isoformat()}
+    return {'stringValue': str(value)}
+
+
+def get_response(cursor):
+    """
+    Returns the Data API response of an executed statement, the rows of a SELECT are not counted as updated
+    :param cursor: the psycopg cursor
+    :return: the response - records and numberOfRecordsUpdated
+    """
+    response = {'numberOfRecordsUpdated': 0}
+    if cursor.description is not None:
+        response['records'] = [[get_field(value) for value in row] for row in cursor.fetchall()]
+    if not (cursor.statusmessage or "").startswith("SELECT"):
+        response['numberOfRecordsUpdated'] = max(cursor.rowcount, 0)
+    return response
+
+
+# Global variable for the DB backend, kept across warm invocations
+db_backend = None
+
+
+def get_backend(config):
+    """
+    Returns the DB backend configured by db-backend
+    data-api - the RDS Data API(default), postgres - direct connections to db-dsn with psycopg, up to
+    max-concurrency connections
+    :param config: the configuration dictionary
+    :return: the backend
+    """
+    global db_backend
+    backend_type = config.get('db-backend', 'data-api')
+    if backend_type == 'data-api':
+        if not isinstance(db_backend, DataApiBackend) or db_backend.cluster_arn != config['db-cluster-arn'] \
+                or db_backend.secret_arn != config['db-secret']:
+            db_backend = DataApiBackend(config['db-secret'], config['db-cluster-arn'])
+    elif backend_type == 'postgres':
+        if not isinstance(db_backend, PostgresBackend) or db_backend.dsn != config['db-dsn']:
+            db_backend = PostgresBackend(config['db-dsn'], common.max_concurrency)
+    else:
+        raise ValueError("Unknown db-backend {0}".format(backend_type))
+    return db_backend
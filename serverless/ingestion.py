@@ -0,0 +1,185 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import common
+import hashlib
+import json
+import sqlite3
+import threading
+import logging
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+
+# Query parameters which only track the referrer of a page, dropped from the normalized url
+TRACKING_PARAMETERS = ('utm_', 'fbclid', 'gclid')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Ingestion status of an article
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+
+def normalize_url(url):
+    """
+    Normalize a url so the different spellings of the same article share one index entry - lower cased scheme and
+    host, no default port, no fragment, no tracking parameters, sorted query parameters and no trailing slash
+    :param url: the url
+    :return: the normalized url
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += ":{0}".format(parts.port)
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not name.lower().startswith(TRACKING_PARAMETERS)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def get_content_hash(text):
+    """
+    Returns the sha256 of a text, the same hash as the content_hash of the newsfeed messages
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_ingestion_status(entry, content_hash):
+    """
+    Compare an extracted text with the indexed one
+    :param entry: the index entry of the url, None when the url was never ingested
+    :param content_hash: the hash of the extracted text
+    :return: new/changed/unchanged
+    """
+    if entry is None:
+        return NEW
+    if entry.get('content_hash') == content_hash:
+        return UNCHANGED
+    return CHANGED
+
+
+def new_entry(url, etag, last_modified, content_hash, newsfeed_name):
+    """
+    Returns the index entry of an ingested article
+    """
+    return {
+        "url": normalize_url(url),
+        "etag": etag,
+        "last_modified": last_modified,
+        "content_hash": content_hash,
+        "newsfeed_name": newsfeed_name,
+        "update_datetime": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+class SqliteIngestionIndex:
+    """
+    Ingestion index kept in a local SQLite file - for tests and local runs, a Lambda container only sees its own
+    /tmp file
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the SQLite database file, ':memory:' for an in-memory index
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS ingestion_index ("
+                                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, "
+                                "newsfeed_name TEXT, update_datetime TEXT)")
+        self.connection.commit()
+
+    def get(self, url):
+        """
+        :param url: the url of the article
+        :return: the index entry of the url, None when the url was never ingested
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT url, etag, last_modified, content_hash, newsfeed_name, "
+                                          "update_datetime FROM ingestion_index WHERE url = ?",
+                                          (normalize_url(url),)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["url", "etag", "last_modified", "content_hash", "newsfeed_name", "update_datetime"], row))
+
+    def put(self, entry):
+        """
+        Add or replace the index entry of a url
+        :param entry: the index entry, see new_entry
+        """
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO ingestion_index(url, etag, last_modified, content_hash, "
+                                    "newsfeed_name, update_datetime) VALUES (?, ?, ?, ?, ?, ?)",
+                                    (entry["url"], entry["etag"], entry["last_modified"], entry["content_hash"],
+                                     entry["newsfeed_name"], entry["update_datetime"]))
+            self.connection.commit()
+
+
+class S3IngestionIndex:
+    """
+    Ingestion index shared by all the containers, one JSON object per url under a prefix of the newsfeed bucket
+    """
+
+    def __init__(self, bucket, prefix='ingestion-index'):
+        """
+        :param bucket: the bucket of the index
+        :param prefix: the prefix of the index within the bucket
+        """
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get_key(self, url):
+        return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """
+        :param url: the url of the article
+        :return: the index entry of the url, None when the url was never ingested
+        """
+        s3 = common.get_client('s3')
+        try:
+            with common.outbound_slot(), common.timed('s3.get_object'):
+                serialized = s3.get_object(Bucket=self.bucket,
+                                           Key=self.prefix + '/' + self.get_key(url) + '.json')['Body'].read()
+        except s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(serialized)
+
+    def put(self, entry):
+        """
+        Add or replace the index entry of a url
+        :param entry: the index entry, see new_entry
+        """
+        common.save_content_to_bucket(self.bucket, self.prefix, self.get_key(entry["url"]), ".json", entry, "JSON")
+
+
+# Global variable for the ingestion index, kept across warm invocations
+ingestion_index = None
+
+
+def get_ingestion_index(config):
+    """
+    Returns the ingestion index configured by ingestion-index
+    none - no index(default), sqlite - SQLite file at ingestion-index-path, s3 - under the "ingestion-index" prefix
+    of the newsfeed bucket
+    :param config: the configuration dictionary
+    :return: the index, None when disabled
+    """
+    global ingestion_index
+    index_mode = config.get('ingestion-index', 'none')
+    if index_mode == 'none':
+        return None
+    if index_mode == 'sqlite':
+        path = config.get('ingestion-index-path', '/tmp/ingestion-index.db')
+        if not isinstance(ingestion_index, SqliteIngestionIndex) or ingestion_index.path != path:
+            ingestion_index = SqliteIngestionIndex(path)
+    elif index_mode == 's3':
+        if not isinstance(ingestion_index, S3IngestionIndex) or ingestion_index.bucket != config['newsfeed-bucket']:
+            ingestion_index = S3IngestionIndex(config['newsfeed-bucket'])
+    else:
+        raise ValueError("Unknown ingestion-index {0}".format(index_mode))
+    return ingestion_index
@@ -0,0 +1,173 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import codecs
+import csv
+import gzip
+import itertools
+import shutil
+import tempfile
+import time
+import logging
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+
+# Watchlist file formats by key suffix
+WATCHLIST_FORMATS = [('.csv.gz', 'csv.gz'), ('.parquet', 'parquet'), ('.csv', 'csv')]
+# The maximal length of the entity and entity type, the size of the watchlist table columns
+MAX_VALUE_LENGTH = 255
+# Names of the header row of a CSV watchlist, in lower case
+HEADER_NAMES = [('entity', 'entity type'), ('entity', 'entity_type'), ('entity', 'type')]
+# Number of rejected rows logged with their reason
+MAX_LOGGED_REJECTS = 10
+
+
+def get_watchlist_format(key):
+    """
+    Returns the format of a watchlist file from its key
+    :param key: the S3 key of the file
+    :return: csv, csv.gz or parquet
+    """
+    for suffix, file_format in WATCHLIST_FORMATS:
+        if key.lower().endswith(suffix):
+            return file_format
+    raise ValueError("Unknown watchlist file format {0}, expected .csv, .csv.gz or .parquet".format(key))
+
+
+class WatchlistLoader:
+    """
+    Reads the watchlist records of a file incrementally, in chunks of a fixed number of rows. The rows of each chunk
+    are validated and normalized, and only the chunk is held in memory, so a chunk can be inserted before the next one
+    is read. Rows without an entity or an entity type, or longer than the table columns, are rejected and counted
+    """
+
+    def __init__(self, body, file_format, chunk_size=1000, header='auto'):
+        """
+        :param body: the binary file object of the watchlist file, e.g. the S3 object body
+        :param file_format: csv, csv.gz or parquet, parquet requires the pyarrow package
+        :param chunk_size: the number of rows per chunk
+        :param header: true - the first CSV row is a header, false - no header, auto - the first row is a header when
+        it holds the column names(entity and entity type)
+        """
+        self.body = body
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.header = header
+        self.rows = 0
+        self.rejected = 0
+        self.read_seconds = 0.0
+
+    def chunks(self):
+        """
+        Read the file
+        :return: generator of the chunks, lists of entity and entity_type values
+        """
+        rows = self.read_rows()
+        while True:
+            start = time.perf_counter()
+            records = []
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            for row in chunk:
+                self.rows += 1
+                record, reason = normalize_row(row)
+                if record is None:
+                    self.rejected += 1
+                    if self.rejected <= MAX_LOGGED_REJECTS:
+                        log.warning("Rejected watchlist row {0} - {1}: {2:.200}".format(
+                            self.rows, reason, str(row)))
+                else:
+                    records.append(record)
+            self.read_seconds += time.perf_counter() - start
+            if not chunk:
+                return
+            yield records
+
+    def records(self):
+        """
+        Read the file
+        :return: generator of the entity and entity_type values, read a chunk at a time
+        """
+        return itertools.chain.from_iterable(self.chunks())
+
+    def read_rows(self):
+        if self.file_format == 'parquet':
+            return read_parquet_rows(self.body, self.chunk_size)
+        body = gzip.GzipFile(fileobj=self.body, mode='rb') if self.file_format == 'csv.gz' else self.body
+        return read_csv_rows(body, self.header)
+
+    def get_counts(self):
+        """
+        Returns the counts of the file read so far
+        :return: dictionary of the format, the rows read, the rows rejected and the time spent reading them
+        """
+        return {
+            'format': self.file_format,
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'read_ms': round(self.read_seconds * 1000, 3)
+        }
+
+
+def read_csv_rows(body, header='auto'):
+    """
+    Read the rows of a CSV file line by line, the first two columns are the entity and the entity type
+    :param body: the binary file object of the CSV file, UTF-8 with or without a byte order mark
+    :param header: see WatchlistLoader
+    :return: generator of the rows, blank rows are skipped
+    """
+    rows = csv.reader(codecs.getreader('utf-8-sig')(body))
+    first = next(rows, None)
+    if first is not None and not is_header(first, header):
+        yield first
+    for row in rows:
+        if row:
+            yield row
+
+
+def is_header(row, header):
+    if header == 'auto':
+        return tuple(value.strip().lower() for value in row[:2]) in HEADER_NAMES
+    return str(header).lower() == 'true'
+
+
+def read_parquet_rows(body, batch_size):
+    """
+    Read the rows of a Parquet file by record batches, the entity and entity_type columns are read, or the first two
+    columns when the file has no such columns. The footer of a Parquet file is at its end, so the file is first copied
+    to a temporary file - on the Lambda /tmp storage, not in memory. pyarrow is only imported for the parquet format
+    :param body: the binary file object of the Parquet file
+    :param batch_size: the number of rows per record batch
+    :return: generator of the rows
+    """
+    import pyarrow.parquet
+    with tempfile.TemporaryFile() as file:
+        shutil.copyfileobj(body, file, 1024 * 1024)
+        file.seek(0)
+        parquet_file = pyarrow.parquet.ParquetFile(file)
+        columns = parquet_file.schema_arrow.names
+        if 'entity' in columns and 'entity_type' in columns:
+            columns = ['entity', 'entity_type']
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns[:2]):
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+
+
+def normalize_row(row):
+    """
+    Validate and normalize a watchlist row, the surrounding white space of the values is removed and the inner white
+    space is collapsed to single spaces
+    :param row: the row values - entity and entity type first
+    :return: the record and None, or None and the reason of the rejection
+    """
+    if len(row) < 2:
+        return None, "missing entity type"
+    values = []
+    for name, value in zip(('entity', 'entity_type'), row):
+        if value is None:
+            return None, "missing " + name
+        value = " ".join(str(value).split())
+        if not value:
+            return None, "empty " + name
+        if len(value) > MAX_VALUE_LENGTH:
+            return None, "{0} longer than {1} characters".format(name, MAX_VALUE_LENGTH)
+        values.append(value)
+    return {'entity': values[0], 'entity_type': values[1]}, None
@@ -1,30 +1,154 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import boto3
 import common
-import os
 import json
+import threading
+import time
 import logging
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
+# SNS publish_batch accepts up to 10 messages per request
+PUBLISH_BATCH_SIZE = 10
+# SNS message size limit, a notification above it is split
+MAX_MESSAGE_BYTES = 256 * 1024
+
+# Global variable for the time an entity was last notified for a url, kept across warm invocations
+notified = {}
+notified_lock = threading.Lock()
+
+
+class NotificationAggregator:
+    """
+    Collects the matches of an evaluate_newsfeed invocation and publishes them once all the messages are processed.
+    The matches of an entity already notified for the same url within notification-dedup-window seconds are
+    suppressed, the articles left are grouped by up to notification-max-articles per notification
+    """
+
+    def __init__(self, config):
+        """
+        :param config: the configuration dictionary
+        """
+        self.topic_arn = config['sns-notification-topic']
+        self.window = float(config.get('notification-dedup-window', 3600))
+        self.max_articles = max(1, int(config.get('notification-max-articles', 1)))
+        self.articles = []
+        self.lock = threading.Lock()
+        self.stats = dict.fromkeys(['matches', 'suppressed', 'notifications', 'published', 'failed'], 0)
+
+    def add(self, content):
+        """
+        Add the matches of an article, repeated matches are dropped
+        :param content: the match content - results(entity, entity_type, create_timestamp), url and sentiment
+        """
+        now = time.time()
+        # the same entity can be matched by several keywords of the article
+        matches = {(result['entity'], result['entity_type'], content['url']): result for result in content['results']}
+        results = []
+        with notified_lock:
+            for key, result in matches.items():
+                if now - notified.get(key, float('-inf')) < self.window:
+                    self.stats['suppressed'] += 1
+                    continue
+                notified[key] = now
+                results.append(result)
+            self.stats['matches'] += len(matches)
+        if results:
+            with self.lock:
+                self.articles.append(dict(content, results=results))
+
+    def get_notifications(self):
+        """
+        Returns the notification contents of the collected articles, one article keeps the detect_watchlist format
+        and several articles are listed under articles
+        """
+        groups = []
+        group = []
+        for article in self.articles:
+            # the message is serialized twice by the SNS json message structure, so half of the limit is kept
+            if group and (len(group) == self.max_articles or
+                          len(json.dumps({'articles': group + [article]})) > MAX_MESSAGE_BYTES // 2):
+                groups.append(group)
+                group = []
+            group.append(article)
+        if group:
+            groups.append(group)
+        return [group[0] if len(group) == 1 else {'articles': group} for group in groups]
+
+    def flush(self):
+        """
+        Publish the collected matches, with publish_batch when available in the boto3 version, else one publish
+        per notification
+        :return: the statistics - matches, suppressed, notifications, published and failed
+        """
+        with self.lock:
+            notifications = self.get_notifications()
+            self.articles = []
+        prune_notified(self.window)
+        self.stats['notifications'] += len(notifications)
+        if notifications:
+            client = common.get_client('sns')
+            messages = [{
+                'Message': json.dumps({'default': json.dumps(notification)}),
+                'Subject': 'Watchlist Matched!',
+                'MessageStructure': 'json'
+            } for notification in notifications]
+            log.info("Publishing {0} notifications".format(len(messages)))
+            if hasattr(client, 'publish_batch') and len(messages) > 1:
+                self.publish_batch(client, messages)
+            else:
+                for message in messages:
+                    self.publish(client, message)
+        log.info("Notification stats {0}".format(json.dumps(self.stats)))
+        return self.stats
+
+    def publish(self, client, message):
+        try:
+            with common.outbound_slot(), common.timed('sns.publish'):
+                client.publish(TopicArn=self.topic_arn, **message)
+            self.stats['published'] += 1
+        except Exception:
+            log.error("Error publishing a notification", exc_info=True)
+            self.stats['failed'] += 1
+
+    def publish_batch(self, client, messages):
+        for start in range(0, len(messages), PUBLISH_BATCH_SIZE):
+            entries = [dict(message, Id=str(index))
+                       for index, message in enumerate(messages[start:start + PUBLISH_BATCH_SIZE])]
+            try:
+                with common.outbound_slot(), common.timed('sns.publish_batch'):
+                    response = client.publish_batch(TopicArn=self.topic_arn, PublishBatchRequestEntries=entries)
+            except Exception:
+                log.error("Error publishing a notification batch", exc_info=True)
+                self.stats['failed'] += len(entries)
+                continue
+            self.stats['published'] += len(response.get('Successful', []))
+            for failed in response.get('Failed', []):
+                log.error("Error publishing a notification {0}: {1}".format(failed.get('Code'), failed.get('Message')))
+                self.stats['failed'] += 1
+
+
+def prune_notified(window):
+    """
+    Drop the notified entities older than the suppression window
+    :param window: the suppression window in seconds
+    """
+    expiry = time.time() - window
+    with notified_lock:
+        for key in [key for key, notified_time in notified.items() if notified_time <= expiry]:
+            del notified[key]
+
 
 def detect_watchlist(content):
+    """
+    Publish the matches of a single article, repeated matches within notification-dedup-window are suppressed
+    :param content: the match content - results, url and sentiment
+    :return: the notification statistics
+    """
     try:
-        config = common.get_secret(os.environ['SECRET'])
-        client = boto3.client('sns')
-        print("Publishing a Match")
-        response = client.publish(
-            TopicArn=config['sns-notification-topic'],
-            Message=json.dumps(
-                {
-                    'default': json.dumps(content)
-                 }),
-            Subject='Watchlist Matched!',
-            MessageStructure='json'
-        )
-
-    except Exception as e:
-        print("Error executing evaluate_newsfeed ", e)
-
+        aggregator = NotificationAggregator(common.get_config())
+        aggregator.add(content)
+        return aggregator.flush()
+    except Exception:
+        log.error("Error executing detect_watchlist", exc_info=True)
@@ -0,0 +1,400 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from collections import deque
+import base64
+import hashlib
+import math
+import re
+import unicodedata
+import logging
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+
+# Postgres fuzzystrmatch soundex codes for the letters A-Z
+SOUNDEX_TABLE = "01230120022455012623010202"
+SOUNDEX_LEN = 4
+MAX_DISTANCE = 2
+# A word of a phrase - letters and digits, with the combining accents of decomposed characters
+PHRASE_WORD = re.compile(r'(?:[^\W_]|[\u0300-\u036f])+')
+
+
+def _is_alpha(char):
+    return ('a' <= char <= 'z') or ('A' <= char <= 'Z')
+
+
+def _soundex_code(char):
+    if _is_alpha(char):
+        return SOUNDEX_TABLE[ord(char.upper()) - ord('A')]
+    return char
+
+
+def soundex(text):
+    """
+    Python port of the Postgres fuzzystrmatch soundex function, so in-process matching returns the same
+    codes as soundex() in the database
+    :param text: the input text
+    :return: the four characters soundex code, or an empty string when the text holds no letters
+    """
+    i = 0
+    while i < len(text) and not _is_alpha(text[i]):
+        i += 1
+    if i == len(text):
+        return ""
+    result = [text[i].upper()]
+    i += 1
+    while i < len(text) and len(result) < SOUNDEX_LEN:
+        if _is_alpha(text[i]) and _soundex_code(text[i]) != _soundex_code(text[i - 1]):
+            code = _soundex_code(text[i])
+            if code != '0':
+                result.append(code)
+        i += 1
+    return "".join(result).ljust(SOUNDEX_LEN, '0')
+
+
+def levenshtein(source, target):
+    """
+    Levenshtein distance with unit costs for insert, delete and substitute
+    :param source: the first string
+    :param target: the second string
+    :return: the edit distance between both strings
+    """
+    if len(source) < len(target):
+        source, target = target, source
+    previous = list(range(len(target) + 1))
+    for i, source_char in enumerate(source, 1):
+        current = [i]
+        for j, target_char in enumerate(target, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (source_char != target_char)))
+        previous = current
+    return previous[-1]
+
+
+def levenshtein_less_equal(source, target, max_distance):
+    """
+    Same contract as the Postgres levenshtein_less_equal function - the exact distance is returned when it is at
+    most max_distance, otherwise any value greater than max_distance. Only the diagonal band of width
+    2 * max_distance + 1 is computed, cells outside of it are known to exceed max_distance
+    :param source: the first string
+    :param target: the second string
+    :param max_distance: the maximal distance of interest
+    :return: the edit distance, or max_distance + 1 once the distance is known to exceed max_distance
+    """
+    exceeded = max_distance + 1
+    if abs(len(source) - len(target)) > max_distance:
+        return exceeded
+    previous = [min(j, exceeded) for j in range(len(target) + 1)]
+    for i, source_char in enumerate(source, 1):
+        current = [exceeded] * (len(target) + 1)
+        current[0] = min(i, exceeded)
+        row_min = current[0]
+        for j in range(max(1, i - max_distance), min(len(target), i + max_distance) + 1):
+            distance = min(previous[j] + 1,
+                           current[j - 1] + 1,
+                           previous[j - 1] + (source_char != target[j - 1]),
+                           exceeded)
+            current[j] = distance
+            if distance < row_min:
+                row_min = distance
+        if row_min > max_distance:
+            return exceeded
+        previous = current
+    return previous[-1]
+
+
+def split_pieces(text, count):
+    """
+    Split a text into count contiguous pieces of nearly equal length. By the pigeonhole principle, a text within
+    count - 1 edits of another text shares at least one of its pieces unchanged with it
+    :param text: the text to split
+    :param count: the number of pieces
+    :return: list of the pieces
+    """
+    size, remainder = divmod(len(text), count)
+    pieces = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < remainder else 0)
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+class WatchlistMatcher:
+    """
+    In-memory equivalent of the watchlist fuzzy match query - a watchlist record matches a keyword when their
+    lower cased soundex codes are equal, or when their lower cased levenshtein distance is at most 2.
+    Entities are bucketed by length, so a keyword is only compared with the entities at most 2 characters
+    longer or shorter, and the bounded distance runs only on the entities sharing one of its pigeonhole pieces
+    """
+
+    def __init__(self, records):
+        """
+        :param records: watchlist records in the Data API format - entity, entity_type, create_datetime
+        """
+        self.records = records
+        self.soundex_index = {}
+        # length -> lower cased entity -> record positions
+        self.length_index = {}
+        for position, record in enumerate(records):
+            entity = record[0].get('stringValue', "").lower()
+            self.soundex_index.setdefault(soundex(entity), []).append(position)
+            self.length_index.setdefault(len(entity), {}).setdefault(entity, []).append(position)
+        log.info("Indexed {0} watchlist records".format(len(records)))
+
+    def match(self, keyword):
+        """
+        Match a single keyword against the watchlist
+        :param keyword: the keyword to match
+        :return: the matching records in the Data API format
+        """
+        keyword_lowered = keyword.lower()
+        positions = set(self.soundex_index.get(soundex(keyword_lowered), []))
+        pieces = split_pieces(keyword_lowered, MAX_DISTANCE + 1)
+        # with an empty piece, i.e. a keyword shorter than the pieces count, every entity has to be compared
+        filtered = all(pieces)
+        for length in range(len(keyword_lowered) - MAX_DISTANCE, len(keyword_lowered) + MAX_DISTANCE + 1):
+            for entity, entity_positions in self.length_index.get(length, {}).items():
+                if filtered and not any(piece in entity for piece in pieces):
+                    continue
+                if levenshtein_less_equal(keyword_lowered, entity, MAX_DISTANCE) <= MAX_DISTANCE:
+                    positions.update(entity_positions)
+        return [self.records[position] for position in sorted(positions)]
+
+
+def normalize_word(word):
+    """
+    Normalize a word for phrase matching - lower cased, without accents
+    :param word: the word
+    :return: the normalized word
+    """
+    word = word.lower()
+    if word.isascii():
+        return word
+    return "".join(char for char in unicodedata.normalize('NFKD', word) if not unicodedata.combining(char))
+
+
+def normalize_phrase(text):
+    """
+    Split a text into normalized words, the separators - whitespaces and punctuation - are ignored
+    :param text: the text
+    :return: list of the normalized words
+    """
+    return [normalize_word(word) for word in PHRASE_WORD.findall(text)]
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton of the normalized watchlist entities, with words as the symbols. A text is scanned in a
+    single pass over its words for all the entities at once, an entity matches the same words in the same order
+    whatever the case, accents, whitespaces and punctuation between them
+    """
+
+    def __init__(self, records):
+        """
+        :param records: watchlist records in the Data API format - entity, entity_type, create_datetime
+        """
+        self.records = records
+        # per node - word transitions, failure link, depth in words, record positions of the entities ending at the
+        # node, and link to the nearest failure node with positions
+        self.transitions = [{}]
+        self.failures = [0]
+        self.depths = [0]
+        self.outputs = [[]]
+        self.output_links = [0]
+        for position, record in enumerate(records):
+            node = 0
+            for word in normalize_phrase(record[0].get('stringValue', "")):
+                next_node = self.transitions[node].get(word)
+                if next_node is None:
+                    next_node = len(self.transitions)
+                    self.transitions[node][word] = next_node
+                    self.transitions.append({})
+                    self.failures.append(0)
+                    self.depths.append(self.depths[node] + 1)
+                    self.outputs.append([])
+                    self.output_links.append(0)
+                node = next_node
+            if node:
+                self.outputs[node].append(position)
+        # breadth first, the failure link of a node is the longest proper suffix of its phrase within the automaton
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self.transitions[node].items():
+                failure = self.failures[node]
+                while failure and word not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                if node:
+                    failure = self.transitions[failure].get(word, 0)
+                self.failures[child] = failure
+                self.output_links[child] = failure if self.outputs[failure] else self.output_links[failure]
+                queue.append(child)
+        log.info("Built phrase matcher of {0} nodes for {1} watchlist records".format(len(self.transitions),
+                                                                                     len(records)))
+
+    def scan(self, text):
+        """
+        Find the watchlist entities in a text
+        :param text: the text to scan
+        :return: list of the hits in text order - start and end offsets of the matching text, and the watchlist
+        record in the Data API format
+        """
+        words = [(word.start(), word.end(), normalize_word(word.group())) for word in PHRASE_WORD.finditer(text)]
+        hits = []
+        node = 0
+        for index, (start, end, word) in enumerate(words):
+            while node and word not in self.transitions[node]:
+                node = self.failures[node]
+            node = self.transitions[node].get(word, 0)
+            output = node if self.outputs[node] else self.output_links[node]
+            while output:
+                phrase_start = words[index - self.depths[output] + 1][0]
+                for position in self.outputs[output]:
+                    hits.append({'start': phrase_start, 'end': end, 'record': self.records[position]})
+                output = self.output_links[output]
+        return hits
+
+
+def get_piece_signatures(entity):
+    """
+    Returns the signatures of the pigeonhole pieces of an entity - entity length, piece index and piece. A keyword
+    within MAX_DISTANCE edits of the entity holds one of the pieces unchanged, shifted by at most MAX_DISTANCE
+    characters, see get_keyword_signatures
+    :param entity: the lower cased entity, at least MAX_DISTANCE + 1 characters long
+    :return: list of the signatures
+    """
+    return ["{0}:{1}:{2}".format(len(entity), index, piece)
+            for index, piece in enumerate(split_pieces(entity, MAX_DISTANCE + 1))]
+
+
+def get_keyword_signatures(keyword, length):
+    """
+    Returns the signatures of the keyword substrings which could be the unchanged pieces of an entity of the given
+    length within MAX_DISTANCE edits of the keyword
+    :param keyword: the lower cased keyword
+    :param length: the entity length, at least MAX_DISTANCE + 1
+    :return: list of the signatures
+    """
+    signatures = []
+    offset = 0
+    for index, piece in enumerate(split_pieces("x" * length, MAX_DISTANCE + 1)):
+        for start in range(max(0, offset - MAX_DISTANCE), min(len(keyword) - len(piece), offset + MAX_DISTANCE) + 1):
+            signatures.append("{0}:{1}:{2}".format(length, index, keyword[start:start + len(piece)]))
+        offset += len(piece)
+    return signatures
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings, with md5 based double hashing so the bit positions are the same in every process
+    """
+
+    def __init__(self, bits, hashes, data=None):
+        """
+        :param bits: the number of bits
+        :param hashes: the number of bit positions per string
+        :param data: the bits, default is an empty filter
+        """
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate):
+        """
+        Returns an empty filter sized for a number of strings and a false positive rate
+        """
+        capacity = max(1, capacity)
+        bits = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+        return cls(bits, max(1, int(round(bits / capacity * math.log(2)))))
+
+    def get_positions(self, item):
+        digest = hashlib.md5(item.encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.bits for index in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.get_positions(item):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self.get_positions(item))
+
+
+class KeywordPrefilter:
+    """
+    Conservative pre-filter of the watchlist fuzzy match - drops the keywords that cannot match any watchlist entity
+    A keyword passes when its soundex code is the code of an entity, or when an entity length is within 2 of the
+    keyword length and the Bloom filter of the entity piece signatures holds one of the keyword signatures for that
+    length(see get_piece_signatures). Entities shorter than the pieces count are only checked by length. A keyword
+    matching an entity always passes, a keyword without a match may pass at the false positive rate of the filter
+    """
+
+    def __init__(self, soundex_codes, lengths, bloom, version=None):
+        """
+        :param soundex_codes: the soundex codes of the lower cased entities
+        :param lengths: the lengths of the lower cased entities
+        :param bloom: the Bloom filter of the piece signatures of the lower cased entities
+        :param version: the watchlist version of the entities
+        """
+        self.soundex_codes = set(soundex_codes)
+        self.lengths = set(lengths)
+        self.bloom = bloom
+        self.version = version
+
+    @classmethod
+    def from_records(cls, records, false_positive_rate=0.01, version=None):
+        """
+        Build the pre-filter of watchlist records
+        :param records: watchlist records in the Data API format - entity, entity_type, create_datetime
+        :param false_positive_rate: the false positive rate of the Bloom filter
+        :param version: the watchlist version of the records
+        :return: the pre-filter
+        """
+        entities = {record[0].get('stringValue', "").lower() for record in records}
+        bloom = BloomFilter.for_capacity(len(entities) * (MAX_DISTANCE + 1), false_positive_rate)
+        for entity in entities:
+            if len(entity) > MAX_DISTANCE:
+                for signature in get_piece_signatures(entity):
+                    bloom.add(signature)
+        log.info("Built keyword pre-filter of {0} entities, {1} bits".format(len(entities), bloom.bits))
+        return cls({soundex(entity) for entity in entities}, {len(entity) for entity in entities}, bloom, version)
+
+    def may_match(self, keyword):
+        """
+        :param keyword: the keyword
+        :return: False when the keyword cannot match any watchlist entity
+        """
+        keyword_lowered = keyword.lower()
+        if soundex(keyword_lowered) in self.soundex_codes:
+            return True
+        for length in range(len(keyword_lowered) - MAX_DISTANCE, len(keyword_lowered) + MAX_DISTANCE + 1):
+            if length not in self.lengths:
+                continue
+            if length <= MAX_DISTANCE:
+                return True
+            if any(signature in self.bloom for signature in get_keyword_signatures(keyword_lowered, length)):
+                return True
+        return False
+
+    def to_dict(self):
+        return {
+            "version": self.version,
+            "soundex": sorted(self.soundex_codes),
+            "lengths": sorted(self.lengths),
+            "bloom": {
+                "bits": self.bloom.bits,
+                "hashes": self.bloom.hashes,
+                "data": base64.b64encode(bytes(self.bloom.data)).decode('ascii')
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, content):
+        bloom = content["bloom"]
+        return cls(content["soundex"], content["lengths"],
+                   BloomFilter(bloom["bits"], bloom["hashes"], base64.b64decode(bloom["data"])), content["version"])
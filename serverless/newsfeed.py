@@ -1,22 +1,26 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import requests
-from bs4 import BeautifulSoup
 import json
-import boto3
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import os
+import analysis
 import common
+import ingestion
 import match
 import watchlist
 import logging
 log = logging.getLogger()
 log.setLevel(logging.INFO)
+# send_message_batch accepts up to 10 messages and 256KB per request
+SQS_BATCH_SIZE = 10
+SQS_BATCH_MAX_BYTES = 256 * 1024
 stop_words = ['One', 'morning', ',', 'when', 'Gregor', 'Samsa', 'woke', 'from', 'troubled', 'dreams', ',', 'he', 'found', 'himself', 'transformed', 'in', 'his', 'bed', 'into', 'a', 'horrible', 'vermin', '.', 'He', 'lay', 'on', 'his', 'armour-like', 'back', ',', 'and', 'if', 'he', 'lifted', 'his', 'head', 'a', 'little', 'he', 'could', 'see', 'his', 'brown', 'belly', ',', 'slightly', 'domed', 'and', 'divided', 'by', 'arches', 'into', 'stiff', 'sections', '.', 'The', 'bedding', 'was', 'hardly', 'able', 'to', 'cover', 'it', 'and', 'seemed', 'ready', 'to', 'slide', 'off', 'any', 'moment', '.', 'His', 'many', 'legs', ',', 'pitifully', 'thin', 'compared', 'with', 'the', 'size', 'of', 'the', 'rest', 'of', 'him', ',', 'waved', 'about', 'helplessly', 'as', 'he', 'looked', '.', '``', 'What', "'s", 'happened', 'to']
 
 
+@common.metered
 def query_newsfeed(event, context):
     """
     Submit a request with a newsfeed information to be processed
@@ -33,9 +37,26 @@ def query_newsfeed(event, context):
         "extract_sentiment": "true"
     }
     }
+    Bulk mode - a list of newsfeeds, or an RSS/Atom feed whose articles share the same html qualifier, in place of
+    the url, see query_newsfeed_bulk:
+    {
+    "urls": [{"url": "https://...", "html_tag": "article", "html_attribute": {"itemprop": "articleBody"}}],
+    "options": {...}
+    }
+    {
+    "feed_url": "https://.../rss.xml",
+    "html_tag": "article",
+    "html_attribute": {"itemprop": "articleBody"},
+    "options": {...}
+    }
     :param event: see web service example
     :param context:
-    :return: the message ID for the submitted job
+    When the ingestion-index is enabled, a url already ingested is downloaded again only when modified
+    (If-None-Match/If-Modified-Since) and is not pushed to the queue when its text is unchanged
+    :param event: see web service example
+    :param context:
+    :return: the message ID for the submitted job and the ingestion status(new/changed/unchanged), in bulk mode
+    the status and message ID of each newsfeed
     """
     log.info("Hello From query_newsfeed")
 
@@ -69,17 +90,46 @@ def query_newsfeed(event, context):
         log.info("newsfeed_name " + newsfeed_name)
 
         # get secret configuration
-        config = common.get_secret(os.environ['SECRET'])
+        config = common.get_config()
         newsfeed_bucket = config['newsfeed-bucket']
         queue_name = config['incoming-newsfeed-queue']
 
-        # scrap webpage
-        scraped_text = scrape_webpage(url, html_tag, html_attribute)
-        # save page text to bucket
-        common.save_content_to_bucket(newsfeed_bucket, "newsfeed", newsfeed_name, ".txt", scraped_text)
-        # push message to queue
-        sqs_response = push_message_to_queue(queue_name, newsfeed_bucket, newsfeed_name, scraped_text, url,
-                                             extract_entities, extract_keyphrase, extract_sentiment)
+        if 'urls' in req_body or 'feed_url' in req_body:
+            results = query_newsfeed_bulk(config, req_body, newsfeed_name,
+                                          extract_entities, extract_keyphrase, extract_sentiment)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    "options": {
+                        "extract_entities": extract_entities,
+                        "extract_keyphrase": extract_keyphrase,
+                        "extract_sentiment": extract_sentiment
+                    },
+                    "bucket_used": newsfeed_bucket,
+                    "queued": len([result for result in results if result["status"] == "queued"]),
+                    "skipped": len([result for result in results if result["status"] == "skipped"]),
+                    "failed": len([result for result in results if result["status"] == "failed"]),
+                    "results": results
+                })
+            }
+
+        # scrap webpage, unless unchanged since its last ingestion
+        index = ingestion.get_ingestion_index(config)
+        scraped_text, ingestion_status, index_entry = scrape_newsfeed(config, index, url, html_tag, html_attribute,
+                                                                      newsfeed_name)
+        file_generated = None
+        sqs_response = {'MessageId': None}
+        if scraped_text is not None:
+            # save page text to bucket, large texts are compressed
+            encoding = get_text_encoding(config, scraped_text)
+            file_generated = save_newsfeed_text(newsfeed_bucket, newsfeed_name, scraped_text, encoding)
+            # push message to queue, large texts are referenced from the bucket instead of being part of the message
+            sqs_response = push_message_to_queue(queue_name, newsfeed_bucket, newsfeed_name, scraped_text, url,
+                                                 extract_entities, extract_keyphrase, extract_sentiment,
+                                                 file_generated, encoding,
+                                                 int(config.get('sqs-inline-max-bytes', 65536)))
+            if index is not None:
+                index.put(index_entry)
     except Exception as e:
         log.error("Error executing query_newsfeed ", e)
         return {
@@ -95,10 +145,11 @@ def query_newsfeed(event, context):
             "extract_keyphrase": extract_keyphrase,
             "extract_sentiment": extract_sentiment
         },
-        "file_generated": newsfeed_name + ".txt",
+        "file_generated": file_generated,
         "bucket_used": newsfeed_bucket,
         "url": url,
-        "Message ID": str(sqs_response.get('MessageId', "Error"))
+        "ingestion_status": ingestion_status,
+        "Message ID": str(sqs_response.get('MessageId', "Error")) if scraped_text is not None else None
     }
 
     return {
@@ -107,8 +158,165 @@ def query_newsfeed(event, context):
     }
 
 
+def query_newsfeed_bulk(config, req_body, newsfeed_name, extract_entities, extract_keyphrase, extract_sentiment):
+    """
+    Scrape several newsfeeds concurrently(up to bulk-max-workers), save their texts to the bucket and push them to
+    the queue with send_message_batch, a failed newsfeed does not fail the others
+    :param config: the configuration dictionary
+    :param req_body: the request - a urls list of url/html_tag/html_attribute(optional newsfeed_name) newsfeeds,
+    or the feed_url of an RSS/Atom feed with the html_tag/html_attribute of its articles
+    :param newsfeed_name: the name prefix of the newsfeeds without a newsfeed_name
+    :param extract_entities: True/False
+    :param extract_keyphrase: True/False
+    :param extract_sentiment: True/False
+    :return: list of the result of each newsfeed - url, newsfeed_name, status(queued/skipped when unchanged/failed),
+    ingestion_status, file_generated, Message ID or error
+    """
+    import scraper
+    if 'feed_url' in req_body:
+        with common.timed('scrape.feed'):
+            links = scraper.fetch_feed_links(req_body['feed_url'], **get_scraper_options(config))
+        log.info("Found {0} articles in the feed {1}".format(len(links), req_body['feed_url']))
+        newsfeeds = [{"url": link, "html_tag": req_body.get('html_tag'),
+                      "html_attribute": req_body.get('html_attribute')} for link in links]
+    else:
+        newsfeeds = req_body['urls']
+    max_urls = int(config.get('bulk-max-urls', 100))
+    if len(newsfeeds) > max_urls:
+        raise ValueError("{0} newsfeeds requested, above the bulk-max-urls limit of {1}".format(
+            len(newsfeeds), max_urls))
+
+    newsfeed_bucket = config['newsfeed-bucket']
+    inline_max_bytes = int(config.get('sqs-inline-max-bytes', 65536))
+    index = ingestion.get_ingestion_index(config)
+    index_entries = {}
+
+    def prepare_newsfeed(item):
+        position, newsfeed = item
+        result = {
+            "url": newsfeed.get('url'),
+            "newsfeed_name": newsfeed.get('newsfeed_name', "{0}_{1}".format(newsfeed_name, position))
+        }
+        try:
+            scraped_text, result["ingestion_status"], index_entries[position] = scrape_newsfeed(
+                config, index, newsfeed['url'], newsfeed.get('html_tag'), newsfeed.get('html_attribute'),
+                result["newsfeed_name"])
+            if scraped_text is None:
+                result["status"] = "skipped"
+                return result, None
+            encoding = get_text_encoding(config, scraped_text)
+            result["file_generated"] = save_newsfeed_text(newsfeed_bucket, result["newsfeed_name"], scraped_text,
+                                                          encoding)
+            message_body = get_message_body(newsfeed_bucket, result["newsfeed_name"], scraped_text, newsfeed['url'],
+                                            extract_entities, extract_keyphrase, extract_sentiment,
+                                            result["file_generated"], encoding, inline_max_bytes)
+        except Exception as e:
+            log.error("Error preparing newsfeed {0}".format(newsfeed.get('url')), exc_info=True)
+            result.update({"status": "failed", "error": str(e)})
+            return result, None
+        return result, message_body
+
+    max_workers = max(1, min(int(config.get('bulk-max-workers', 8)), len(newsfeeds)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        prepared = list(executor.map(prepare_newsfeed, enumerate(newsfeeds)))
+
+    queued = [(position, result, message_body) for position, (result, message_body) in enumerate(prepared)
+              if message_body is not None]
+    sqs_results = push_messages_to_queue(config['incoming-newsfeed-queue'],
+                                         [message_body for position, result, message_body in queued])
+    for (position, result, message_body), sqs_result in zip(queued, sqs_results):
+        if isinstance(sqs_result, Exception):
+            result.update({"status": "failed", "error": str(sqs_result)})
+        else:
+            result.update({"status": "queued", "Message ID": sqs_result})
+            if index is not None:
+                index.put(index_entries[position])
+    return [result for result, message_body in prepared]
+
+
+def scrape_newsfeed(config, index, url, html_tag, html_attribute, newsfeed_name):
+    """
+    Scrape a newsfeed, a url found in the ingestion index is downloaded only when modified since its last ingestion
+    :param config: the configuration dictionary
+    :param index: the ingestion index, None to always download the url
+    :param url: url of the newsfeed
+    :param html_tag: html qualifier indicating the section of the news
+    :param html_attribute: the matching html attribute to select a particular html tag
+    :param newsfeed_name: the name of the newsfeed
+    :return: the scraped text(None when unchanged), the ingestion status(new/changed/unchanged), and the index
+    entry to save once the newsfeed is pushed to the queue
+    """
+    import scraper
+    entry = index.get(url) if index is not None else None
+    log.info("Scraping : {0}".format(url))
+    with common.timed('scrape'):
+        scraped_text, etag, last_modified = scraper.scrape_if_modified(
+            url, html_tag, html_attribute, etag=entry and entry.get('etag'),
+            last_modified=entry and entry.get('last_modified'), **get_scraper_options(config))
+    log.info("Finished Scraping : {0}".format(url))
+    if scraped_text is None:
+        log.info("Not modified : {0}".format(url))
+        return None, ingestion.UNCHANGED, None
+    content_hash = ingestion.get_content_hash(scraped_text)
+    ingestion_status = ingestion.get_ingestion_status(entry, content_hash)
+    if ingestion_status == ingestion.UNCHANGED:
+        # the page changed around the same article text, keep the new validators for the next download
+        log.info("Unchanged text : {0}".format(url))
+        index.put(ingestion.new_entry(url, etag, last_modified, content_hash, entry.get('newsfeed_name')))
+        return None, ingestion_status, None
+    return scraped_text, ingestion_status, ingestion.new_entry(url, etag, last_modified, content_hash, newsfeed_name)
+
+
+def get_scraper_options(config):
+    """
+    Returns the scraper timeouts and response size limit of the configuration
+    :param config: the configuration dictionary
+    :return: dictionary of the scraper keyword arguments
+    """
+    import scraper
+    return {
+        'connect_timeout': float(config.get('scraper-connect-timeout', scraper.CONNECT_TIMEOUT)),
+        'read_timeout': float(config.get('scraper-read-timeout', scraper.READ_TIMEOUT)),
+        'max_bytes': int(config.get('scraper-max-bytes', scraper.MAX_RESPONSE_BYTES))
+    }
+
+
+def get_text_encoding(config, scraped_text):
+    """
+    Returns the compression of a newsfeed text in the bucket and in the message reference, texts above
+    sqs-compress-min-bytes are compressed with sqs-compression
+    :param config: the configuration dictionary
+    :param scraped_text: the scraped clean content
+    :return: gzip/zstd, None to save the text as is
+    """
+    if len(scraped_text.encode('utf-8')) > int(config.get('sqs-compress-min-bytes', 65536)):
+        return config.get('sqs-compression', 'gzip')
+    return None
+
+
+def save_newsfeed_text(newsfeed_bucket, newsfeed_name, scraped_text, encoding=None):
+    """
+    Save the scraped text of a newsfeed to the bucket, under the newsfeed prefix
+    :param newsfeed_bucket: the bucket name
+    :param newsfeed_name: the name of the newsfeed
+    :param scraped_text: the scraped clean content
+    :param encoding: gzip/zstd to save the text compressed, None to save it as is
+    :return: the saved file name, None when the text could not be saved
+    """
+    if encoding is None:
+        file_name = newsfeed_name + ".txt"
+        content = scraped_text
+    else:
+        file_name = newsfeed_name + ".txt" + common.CONTENT_ENCODING_SUFFIXES[encoding]
+        content = common.compress_content(scraped_text.encode('utf-8'), encoding)
+    if not common.save_content_to_bucket(newsfeed_bucket, "newsfeed", file_name, "", content):
+        return None
+    return file_name
+
+
 def push_message_to_queue(queue_name, newsfeed_bucket, newsfeed_name, scraped_text, url,
-                          extract_entities, extract_keyphrase, extract_sentiment):
+                          extract_entities, extract_keyphrase, extract_sentiment,
+                          file_name=None, encoding=None, inline_max_bytes=None):
     """
     Push a message to the newsfeed queue and return the message id from SQS Service
     :param queue_name: the queue name to push the message
@@ -119,13 +327,47 @@ def push_message_to_queue(queue_name, newsfeed_bucket, newsfeed_name, scraped_te
     :param extract_entities: True/False
     :param extract_keyphrase: True/False
     :param extract_sentiment: True/False
+    :param file_name: the file name of the text in the bucket, default is the newsfeed name with a .txt suffix
+    :param encoding: the compression of the file in the bucket - gzip/zstd, None when not compressed
+    :param inline_max_bytes: the maximal size of a message body holding the text, None to always send the text
     :return: the sqs response including the message id
     """
-    sqs = boto3.resource('sqs')
+    sqs = common.get_client('sqs')
+    message_body = get_message_body(newsfeed_bucket, newsfeed_name, scraped_text, url,
+                                    extract_entities, extract_keyphrase, extract_sentiment,
+                                    file_name, encoding, inline_max_bytes)
+    queue_url = common.get_queue_url(queue_name)
+    log.info("Processing {0} to SQS".format(newsfeed_name))
+    with common.outbound_slot(), common.timed('sqs.send_message'):
+        sqs_response = sqs.send_message(QueueUrl=queue_url, MessageBody=message_body)
+    common.metrics.add('sqs.send_message.bytes', len(message_body.encode('utf-8')), 'Bytes')
+    return sqs_response
+
+
+def get_message_body(newsfeed_bucket, newsfeed_name, scraped_text, url,
+                     extract_entities, extract_keyphrase, extract_sentiment,
+                     file_name=None, encoding=None, inline_max_bytes=None):
+    """
+    Returns the serialized newsfeed message
+    When the serialized message with the text is above inline_max_bytes, the message holds a reference to the text
+    in the bucket(claim check) instead of the text. The serialized size counts the json escaping of the text -
+    a non ASCII character takes up to 12 bytes once escaped
+    :param newsfeed_bucket: the bucket name of the related message
+    :param newsfeed_name: the name of the newsfeed
+    :param scraped_text: the scraped clean content
+    :param url: the url of the resource
+    :param extract_entities: True/False
+    :param extract_keyphrase: True/False
+    :param extract_sentiment: True/False
+    :param file_name: the file name of the text in the bucket, default is the newsfeed name with a .txt suffix
+    :param encoding: the compression of the file in the bucket - gzip/zstd, None when not compressed
+    :param inline_max_bytes: the maximal size of a message body holding the text, None to always send the text
+    :return: the message body
+    """
     item = {
         "bucket": newsfeed_bucket,
-        "file": newsfeed_name + ".txt",
-        "content": scraped_text,
+        "file": file_name or newsfeed_name + ".txt",
+        "content_hash": hashlib.sha256(scraped_text.encode('utf-8')).hexdigest(),
         "url": url,
         "options": {
             "extract_entities": extract_entities,
@@ -133,67 +375,322 @@ def push_message_to_queue(queue_name, newsfeed_bucket, newsfeed_name, scraped_te
             "extract_sentiment": extract_sentiment,
         }
     }
+    message_body = json.dumps(dict(item, content=scraped_text))
+    if inline_max_bytes is not None and len(message_body.encode('utf-8')) > inline_max_bytes:
+        if file_name is None:
+            raise Exception("Error saving newsfeed {0} to the bucket".format(newsfeed_name))
+        item["key"] = "newsfeed/" + item["file"]
+        item["encoding"] = encoding or "identity"
+        message_body = json.dumps(item)
+    return message_body
 
-    queue = sqs.get_queue_by_name(QueueName=queue_name)
-    log.info("Processing {0} to SQS".format(newsfeed_name))
-    sqs_response = queue.send_message(MessageBody=json.dumps(item))
-    return sqs_response
+
+def push_messages_to_queue(queue_name, message_bodies):
+    """
+    Push messages to the newsfeed queue with send_message_batch, in batches of up to 10 messages and 256KB
+    :param queue_name: the queue name to push the messages
+    :param message_bodies: list of the serialized messages
+    :return: list of the message id of each message, or the exception raised sending it
+    """
+    results = [None] * len(message_bodies)
+    if not message_bodies:
+        return results
+    sqs = common.get_client('sqs')
+    queue_url = common.get_queue_url(queue_name)
+
+    def send_batch(batch):
+        entries = [{'Id': str(index), 'MessageBody': message_bodies[index]} for index in batch]
+        try:
+            with common.outbound_slot(), common.timed('sqs.send_message_batch'):
+                response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        except Exception as e:
+            log.error("Error executing send_message_batch", exc_info=True)
+            for index in batch:
+                results[index] = e
+            return
+        common.metrics.add('sqs.send_message_batch.bytes',
+                           sum(len(entry['MessageBody'].encode('utf-8')) for entry in entries), 'Bytes')
+        for successful in response.get('Successful', []):
+            results[int(successful['Id'])] = successful['MessageId']
+        for failed in response.get('Failed', []):
+            results[int(failed['Id'])] = Exception("{0}: {1}".format(failed.get('Code'), failed.get('Message')))
+
+    batch = []
+    batch_bytes = 0
+    for index, message_body in enumerate(message_bodies):
+        message_bytes = len(message_body.encode('utf-8'))
+        if batch and (len(batch) == SQS_BATCH_SIZE or batch_bytes + message_bytes > SQS_BATCH_MAX_BYTES):
+            send_batch(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(index)
+        batch_bytes += message_bytes
+    send_batch(batch)
+    log.info("Pushed {0} messages to SQS".format(len(message_bodies)))
+    return results
 
 
+@common.metered
 def evaluate_newsfeed(event, context):
     """
     Queue Message Handler which process a newsfeed message
+    When comprehend-batch-mode is enabled, the messages of the SQS batch are analyzed together using the
+    Comprehend batch APIs. When evaluate-concurrency is above 1, up to evaluate-concurrency messages are processed
+    in parallel, and the Comprehend calls and S3 writes of a message overlap. Whatever the number of threads, at
+    most max-concurrency calls to Comprehend, S3, the DB and SNS are in flight(see common.outbound_slot), and the
+    Comprehend calls of each API are rate limited and retried when throttled(see analysis.call_comprehend)
+    The matches of the batch are notified together, and with analysis-output-format jsonl/parquet the analyses of
+    the batch are written to a single file
     :param event:
     :param context:
     :return: Call Match-logic with the resulted Match
     """
     log.info("Hello From process_newsfeed")
-    config = common.get_secret(os.environ['SECRET'])
-    sentiment_result = ""
-    entities_result = ""
-    keyphrase_result = ""
+    config = common.get_config()
+    client = common.get_client('comprehend')
+    max_chunks = int(config.get('comprehend-max-chunks', 1))
+    max_workers = int(config.get('comprehend-max-workers', 4))
+    concurrency = int(config.get('evaluate-concurrency', 1))
+    analysis.configure_rate_limits(config)
+    cache = analysis.get_analysis_cache(config)
+    notifications = match.NotificationAggregator(config)
+    output = analysis.get_analysis_output(config)
+
+    # Read the messages available in the Queue, texts referenced by a message are read from the bucket
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            message_bodies = list(executor.map(read_message, event['Records']))
+    else:
+        message_bodies = [read_message(message) for message in event['Records']]
+    messages = [(message, message_body) for message, message_body in zip(event['Records'], message_bodies)
+                if message_body is not None]
+
+    batch_analyses = None
+    if common.is_enabled(config.get('comprehend-batch-mode', False)):
+        batch_analyses = batch_extract_comprehend(client, messages, max_chunks, cache)
+
+    def evaluate_record(message_item):
+        message, message_body = message_item
+        message_id = message["messageId"]
+        try:
+            log.info("Processing file {0} with Message ID {1}.".format(message_body["file"], message_id))
+            if batch_analyses is not None:
+                analyses = batch_analyses[message_id]
+            else:
+                analyses = extract_comprehend(client, message_body, max_chunks, max_workers, concurrency > 1, cache)
+            evaluate_message(config, message_id, message_body, analyses, concurrency > 1, notifications, output)
+        except Exception as e:
+            log.error("Error executing process_newsfeed with Message", exc_info=True)
 
     # Iterate on messages available in the Queue
-    for message in event['Records']:
-        message_id = message["messageId"]
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(evaluate_record, messages))
+    else:
+        for message_item in messages:
+            evaluate_record(message_item)
+    # publish the matches, and write the analyses, of all the messages together
+    notifications.flush()
+    if output is not None:
+        output.flush(getattr(context, 'aws_request_id', None))
+    if cache is not None:
+        cache.log_stats()
+    return "Processed {0} records.".format(len(event['Records']))
+
+
+def read_message(message):
+    """
+    Parse the body of a newsfeed message, when the message references its text in the bucket the text is read,
+    decompressed and checked against the message content hash
+    :param message: the SQS record
+    :return: the message body including the text content, None when the message could not be read
+    """
+    try:
         message_body = json.loads(message["body"])
-        message_file = message_body["file"]
-        message_content = message_body["content"]
-        message_options = message_body["options"]
-        log.info("Processing file {0} with Message ID {1}.".format(message_file, message_id))
-        url = message_body['url']
+        if "content" not in message_body:
+            s3 = common.get_client('s3')
+            with common.outbound_slot(), common.timed('s3.get_object'):
+                content = s3.get_object(Bucket=message_body["bucket"], Key=message_body["key"])['Body'].read()
+            if message_body.get("encoding", "identity") != "identity":
+                content = common.decompress_content(content, message_body["encoding"])
+            if hashlib.sha256(content).hexdigest() != message_body["content_hash"]:
+                raise ValueError("Content hash mismatch for {0}".format(message_body["key"]))
+            message_body["content"] = content.decode('utf-8')
+    except Exception as e:
+        log.error("Error reading message {0}".format(message.get("messageId")), exc_info=True)
+        return None
+    return message_body
+
+
+def extract_comprehend(client, message_body, max_chunks, max_workers, concurrent=False, cache=None):
+    """
+    Run the Comprehend analyses requested by a message, one message at a time
+    :param client: boto3 comprehend client instance
+    :param message_body: the newsfeed message
+    :param max_chunks: the maximal number of chunks to analyze
+    :param max_workers: the maximal number of concurrent Comprehend calls when analyzing chunks
+    :param concurrent: True to run the analyses of the message in parallel
+    :param cache: Comprehend results cache - if exists
+    :return: dictionary of analysis type(entities/keyphrases/sentiments) to the Comprehend response
+    """
+    message_content = message_body["content"]
+    message_options = message_body["options"]
+    analyses = {}
+    extractions = {}
+    if message_options["extract_entities"]:
+        log.info("extracting entities")
+        extractions['entities'] = extract_comprehend_entities
+    if message_options["extract_keyphrase"]:
+        log.info("extracting keyphrase")
+        extractions['keyphrases'] = extract_comprehend_keyphrase
+    if message_options["extract_sentiment"]:
+        log.info("extracting sentiment")
+        extractions['sentiments'] = extract_comprehend_sentiment
+
+    if cache is not None:
+        content_hash = cache.get_content_hash(message_content, max_chunks)
+        for analysis_type in list(extractions):
+            cached_result = cache.get(analysis_type, content_hash)
+            if cached_result is not None:
+                analyses[analysis_type] = cached_result
+                del extractions[analysis_type]
+
+    if concurrent and len(extractions) > 1:
+        with ThreadPoolExecutor(max_workers=len(extractions)) as executor:
+            futures = {analysis_type: executor.submit(extract, client, message_content, max_chunks, max_workers)
+                       for analysis_type, extract in extractions.items()}
+            extracted = {analysis_type: future.result() for analysis_type, future in futures.items()}
+    else:
+        extracted = {analysis_type: extract(client, message_content, max_chunks, max_workers)
+                     for analysis_type, extract in extractions.items()}
+    if cache is not None:
+        for analysis_type, analysis_result in extracted.items():
+            cache.put(analysis_type, content_hash, analysis_result)
+    analyses.update(extracted)
+    return analyses
+
+
+def batch_extract_comprehend(client, messages, max_chunks, cache=None):
+    """
+    Run the Comprehend analyses requested by the messages of an SQS batch, using the Comprehend batch APIs
+    :param client: boto3 comprehend client instance
+    :param messages: list of SQS record and message body pairs
+    :param max_chunks: the maximal number of chunks to analyze per message
+    :param cache: Comprehend results cache - if exists
+    :return: dictionary of message id to its analyses, an analysis is a Comprehend response or the exception
+    raised when the message could not be analyzed
+    """
+    batch_analyses = {message["messageId"]: {} for message, message_body in messages}
+    texts = {'entities': {}, 'keyphrases': {}, 'sentiments': {}}
+    content_hashes = {}
+    # messages with the same content as a message of the batch reuse its result
+    duplicates = {}
+    for message, message_body in messages:
+        message_id = message["messageId"]
         try:
-            client = boto3.client('comprehend')
-            newsfeed_bucket = config['newsfeed-bucket']
+            message_content = message_body["content"]
+            message_options = message_body["options"]
+            requested = []
             if message_options["extract_entities"]:
-                log.info("extracting entities")
-                entities_result = extract_comprehend_entities(client, message_content)
-                common.save_content_to_bucket(newsfeed_bucket, "entities", message_id, ".json", entities_result, "JSON")
+                requested.append('entities')
             if message_options["extract_keyphrase"]:
-                log.info("extracting keyphrase")
-                keyphrase_result = extract_comprehend_keyphrase(client, message_content)
-                common.save_content_to_bucket(newsfeed_bucket, "keyphrases", message_id, ".json", keyphrase_result, "JSON")
+                requested.append('keyphrases')
             if message_options["extract_sentiment"]:
-                log.info("extracting sentiment")
-                sentiment_result = extract_comprehend_sentiment(client, message_content)
-                common.save_content_to_bucket(newsfeed_bucket, "sentiments", message_id, ".json", sentiment_result, "JSON")
-
-            results = query_message_match_result(entities_result, keyphrase_result)
-
-            # log.info(results)
-            if len(results) > 0:
-                log.info("Match Found!")
-                content = {
-                    "results": results,
-                    "url": url,
-                    "sentiment": sentiment_result
-                }
-                # calling match logic with provided match result
-                match.detect_watchlist(content)
-
+                requested.append('sentiments')
         except Exception as e:
-            log.error("Error executing process_newsfeed with Message", exc_info=True)
-    return "Processed {0} records.".format(len(event['Records']))
+            # the error is raised, and logged, when the message is evaluated
+            batch_analyses[message_id]['message'] = ValueError("Invalid message {0}: {1!r}".format(message_id, e))
+            continue
+        if cache is not None:
+            content_hashes[message_id] = cache.get_content_hash(message_content, max_chunks)
+        for analysis_type in requested:
+            cached_result = None
+            if cache is not None:
+                cached_result = cache.get(analysis_type, content_hashes[message_id])
+            if cached_result is not None:
+                batch_analyses[message_id][analysis_type] = cached_result
+            elif cache is not None and (analysis_type, content_hashes[message_id]) in duplicates:
+                duplicates[(analysis_type, content_hashes[message_id])].append(message_id)
+            else:
+                texts[analysis_type][message_id] = message_content
+                if cache is not None:
+                    duplicates[(analysis_type, content_hashes[message_id])] = []
+
+    for analysis_type, analysis_texts in texts.items():
+        if analysis_texts:
+            log.info("extracting {0} for {1} messages".format(analysis_type, len(analysis_texts)))
+            for message_id, result in analysis.batch_analyze(client, analysis_type, analysis_texts,
+                                                             max_chunks).items():
+                batch_analyses[message_id][analysis_type] = result
+                if cache is not None:
+                    for duplicate_id in duplicates[(analysis_type, content_hashes[message_id])]:
+                        batch_analyses[duplicate_id][analysis_type] = result
+                    if not isinstance(result, Exception):
+                        cache.put(analysis_type, content_hashes[message_id], result)
+    return batch_analyses
+
+
+def evaluate_message(config, message_id, message_body, analyses, concurrent=False, notifications=None, output=None):
+    """
+    Save the analyses of a message, match them against the watchlist and notify on a match
+    When watchlist-phrase-scan is enabled, the whole text is also scanned for the watchlist entities as phrases,
+    along with the fuzzy match of the Comprehend entities and key phrases
+    :param config: the configuration dictionary
+    :param message_id: the SQS message id
+    :param message_body: the newsfeed message
+    :param analyses: dictionary of analysis type(entities/keyphrases/sentiments) to the Comprehend response
+    :param concurrent: True to save the analyses in parallel with the watchlist matching
+    :param notifications: the notification aggregator collecting the matches, None to notify the match at once
+    :param output: the per batch analysis output buffer, None to save each analysis to its own object
+    :return: the match results
+    """
+    newsfeed_bucket = config['newsfeed-bucket']
+    for analysis_type, analysis_result in analyses.items():
+        if isinstance(analysis_result, Exception):
+            raise analysis_result
+    entities_result = analyses.get('entities', {'Entities': []})
+    keyphrase_result = analyses.get('keyphrases', {'KeyPhrases': []})
+    sentiment_result = analyses.get('sentiments', "")
+
+    phrase_results = []
+    if common.is_enabled(config.get('watchlist-phrase-scan', False)):
+        phrase_results = query_message_phrase_result(message_body['content'])
+
+    if output is not None:
+        output.add(message_id, message_body['url'], analyses)
+        results = query_message_match_result(entities_result, keyphrase_result)
+    elif concurrent:
+        with ThreadPoolExecutor(max_workers=max(1, len(analyses))) as executor:
+            for analysis_type, analysis_result in analyses.items():
+                executor.submit(common.save_content_to_bucket, newsfeed_bucket, analysis_type, message_id, ".json",
+                                analysis_result, "JSON")
+            results = query_message_match_result(entities_result, keyphrase_result)
+    else:
+        for analysis_type, analysis_result in analyses.items():
+            common.save_content_to_bucket(newsfeed_bucket, analysis_type, message_id, ".json", analysis_result,
+                                          "JSON")
+        results = query_message_match_result(entities_result, keyphrase_result)
+
+    if phrase_results:
+        # the fuzzy matches of the entities already found as phrases are dropped
+        phrase_entities = {(result['entity'], result['entity_type']) for result in phrase_results}
+        results = phrase_results + [result for result in results
+                                    if (result['entity'], result['entity_type']) not in phrase_entities]
+
+    # log.info(results)
+    if len(results) > 0:
+        log.info("Match Found!")
+        content = {
+            "results": results,
+            "url": message_body['url'],
+            "sentiment": sentiment_result
+        }
+        # calling match logic with provided match result
+        if notifications is not None:
+            notifications.add(content)
+        else:
+            match.detect_watchlist(content)
+    return results
 
 
 def query_message_match_result(entities_result, keyphrase_result):
@@ -214,13 +711,13 @@ def query_message_match_result(entities_result, keyphrase_result):
     query_no_duplicates = list(dict.fromkeys(query_list))
     log.info("Collected {0} queries".format(len(query_no_duplicates)))
 
-    # Iterate on all query keys
+    # Match all query keys at once
+    keyword_results = watchlist.query_keywords(query_no_duplicates)
     for key in query_no_duplicates:
-        query, params = watchlist.get_keyword_query(key)
-        query_result = watchlist.execute_statement(query, params)
-        if len(query_result['records']) > 0:
-            log.info(query_result['records'])
-            for rec in query_result['records']:
+        query_records = keyword_results[key]
+        if len(query_records) > 0:
+            log.info(query_records)
+            for rec in query_records:
                 results.append({
                     'entity': rec[0]['stringValue'],
                     'entity_type': rec[1]['stringValue'],
@@ -230,6 +727,31 @@ def query_message_match_result(entities_result, keyphrase_result):
     return results
 
 
+def query_message_phrase_result(text):
+    """
+    Scan the whole text of a message for the watchlist entities, as phrases of normalized words
+    :param text: the newsfeed text
+    :return: the match results, with the start/end offsets of each occurrence of the entity in the text
+    """
+    with common.timed('phrase_scan'):
+        hits = watchlist.get_phrase_matcher().scan(text)
+    results = {}
+    for hit in hits:
+        record = hit['record']
+        key = (record[0]['stringValue'], record[1]['stringValue'])
+        if key not in results:
+            results[key] = {
+                'entity': record[0]['stringValue'],
+                'entity_type': record[1]['stringValue'],
+                'create_timestamp': record[2]['stringValue'],
+                'offsets': []
+            }
+        results[key]['offsets'].append([hit['start'], hit['end']])
+    common.metrics.add('phrase_hits', len(hits))
+    log.info("Found {0} watchlist phrases".format(len(results)))
+    return list(results.values())
+
+
 def clean_words(content):
     query_list = []
     for entity in content:
@@ -242,61 +764,74 @@ def clean_words(content):
     return query_list
 
 
-def scrape_webpage(url, html_tag, html_attribute):
+def scrape_webpage(url, html_tag, html_attribute, config=None):
     """
     Scrap a web page using BeautifulSoup Library and html qualifier
     :param url: url of the newsfeed
     :param html_tag: html qualifier indicating the section of the news
     :param html_attribute: the matching html attribute to select a particular html tag
+    :param config: the configuration dictionary, for the scraper timeouts and response size limit - if exists
     :return: the scraped text of the html page
     """
+    import scraper
+    config = config or {}
     log.info("Scraping : {0}".format(url))
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
-    article = soup.find(html_tag, html_attribute)
-    results = article.text
+    with common.timed('scrape'):
+        results = scraper.scrape(url, html_tag, html_attribute, **get_scraper_options(config))
     log.info("Finished Scraping : {0}".format(url))
     return results
 
 
-def extract_comprehend_entities(client, input_text):
+def extract_comprehend_entities(client, input_text, max_chunks=1, max_workers=4):
     """
     Calling Comprehend Entities API
     :param client: boto3 comprehend client instance
     :param input_text: the input text
+    :param max_chunks: analyze up to max_chunks sentence aligned chunks of the text, 1 analyzes only the text start
+    :param max_workers: the maximal number of concurrent Comprehend calls when analyzing chunks
     :return: Comprehend response
     """
+    def detect_entities(text):
+        return analysis.call_comprehend(client, 'detect_entities', Text=text, LanguageCode='en')
+
+    if max_chunks > 1:
+        chunks, responses = analysis.analyze_chunks(detect_entities, input_text, max_chunks, max_workers)
+        return analysis.merge_entities(chunks, responses)
     # For more info on limited_text check - https://docs.aws.amazon.com/comprehend/latest/dg/API_DetectEntities.html TextSizeLimitExceededException
-    response_entities = client.detect_entities(
-        Text=common.limited_text(input_text, 5000),
-        LanguageCode='en'
-    )
-    return response_entities
+    return detect_entities(common.limited_text(input_text, 5000))
 
 
-def extract_comprehend_keyphrase(client, input_text):
+def extract_comprehend_keyphrase(client, input_text, max_chunks=1, max_workers=4):
     """
     Calling Comprehend KeyPhrase API
     :param client: boto3 comprehend client instance
     :param input_text: the input text
+    :param max_chunks: analyze up to max_chunks sentence aligned chunks of the text, 1 analyzes only the text start
+    :param max_workers: the maximal number of concurrent Comprehend calls when analyzing chunks
     :return: Comprehend response
     """
-    response_key_phrases = client.detect_key_phrases(
-        Text=common.limited_text(input_text, 5000),
-        LanguageCode='en'
-    )
-    return response_key_phrases
+    def detect_key_phrases(text):
+        return analysis.call_comprehend(client, 'detect_key_phrases', Text=text, LanguageCode='en')
+
+    if max_chunks > 1:
+        chunks, responses = analysis.analyze_chunks(detect_key_phrases, input_text, max_chunks, max_workers)
+        return analysis.merge_keyphrases(chunks, responses)
+    return detect_key_phrases(common.limited_text(input_text, 5000))
 
 
-def extract_comprehend_sentiment(client, input_text):
+def extract_comprehend_sentiment(client, input_text, max_chunks=1, max_workers=4):
     """
     Calling Comprehend Sentiment API
     :param client: boto3 comprehend client instance
     :param input_text: the input text
+    :param max_chunks: analyze up to max_chunks sentence aligned chunks of the text, 1 analyzes only the text start
+    :param max_workers: the maximal number of concurrent Comprehend calls when analyzing chunks
     :return: Comprehend response
     """
-    response_sentiment = client.detect_sentiment(
-        Text=common.limited_text(input_text, 5000),
-        LanguageCode='en'
-    )
-    return response_sentiment
+    def detect_sentiment(text):
+        return analysis.call_comprehend(client, 'detect_sentiment', Text=text, LanguageCode='en')
+
+    if max_chunks > 1:
+        chunks, responses = analysis.analyze_chunks(detect_sentiment, input_text, max_chunks, max_workers)
+        return analysis.merge_sentiments(chunks, responses)
+    return detect_sentiment(common.limited_text(input_text, 5000))
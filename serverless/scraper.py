@@ -0,0 +1,176 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import importlib.util
+import requests
+from xml.etree import ElementTree
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
+import logging
+log = logging.getLogger()
+log.setLevel(logging.INFO)
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+MAX_RESPONSE_BYTES = 10 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Global variable for the HTTP session, connections are reused across warm invocations
+session = None
+
+
+def get_session():
+    """
+    Returns the pooled HTTP session
+    :return: requests session
+    """
+    global session
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    return session
+
+
+def get_parser():
+    """
+    Returns the fastest available BeautifulSoup parser - lxml when installed, else the built-in html.parser
+    :return: the parser name
+    """
+    if importlib.util.find_spec('lxml') is not None:
+        return "lxml"
+    return "html.parser"
+
+
+def fetch(url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, max_bytes=MAX_RESPONSE_BYTES, headers=None):
+    """
+    Download a web page, the body is streamed and the download fails once it exceeds max_bytes
+    :param url: url of the page
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: read timeout in seconds
+    :param max_bytes: the maximal size of the response body
+    :param headers: additional request headers - if exists
+    :return: the response and the body bytes
+    """
+    with get_session().get(url, timeout=(connect_timeout, read_timeout), stream=True, headers=headers) as response:
+        response.raise_for_status()
+        content_length = response.headers.get('Content-Length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ValueError("Response of {0} is {1} bytes, above the {2} bytes limit".format(
+                url, content_length, max_bytes))
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError("Response of {0} is above the {1} bytes limit".format(url, max_bytes))
+            chunks.append(chunk)
+    return response, b"".join(chunks)
+
+
+def extract_text(content, html_tag, html_attribute, encoding=None, parser=None):
+    """
+    Extract the text of an html section, only the matching html tag is parsed into a tree
+    :param content: the html page, bytes or text
+    :param html_tag: html qualifier indicating the section of the news
+    :param html_attribute: the matching html attribute to select a particular html tag
+    :param encoding: the encoding of the content bytes, None to detect it from the page
+    :param parser: the BeautifulSoup parser, default is the fastest available parser
+    :return: the text of the section
+    """
+    strainer = SoupStrainer(html_tag, attrs=html_attribute or {})
+    soup = BeautifulSoup(content, parser or get_parser(), parse_only=strainer, from_encoding=encoding)
+    article = soup.find(html_tag, html_attribute or {})
+    if article is None:
+        raise ValueError("No {0} tag with attributes {1} found".format(html_tag, html_attribute))
+    return article.text
+
+
+def scrape(url, html_tag, html_attribute, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+           max_bytes=MAX_RESPONSE_BYTES):
+    """
+    Download a web page and extract the text of an html section
+    :param url: url of the page
+    :param html_tag: html qualifier indicating the section of the news
+    :param html_attribute: the matching html attribute to select a particular html tag
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: read timeout in seconds
+    :param max_bytes: the maximal size of the response body
+    :return: the text of the section
+    """
+    return scrape_if_modified(url, html_tag, html_attribute, connect_timeout=connect_timeout,
+                              read_timeout=read_timeout, max_bytes=max_bytes)[0]
+
+
+def scrape_if_modified(url, html_tag, html_attribute, etag=None, last_modified=None, connect_timeout=CONNECT_TIMEOUT,
+                       read_timeout=READ_TIMEOUT, max_bytes=MAX_RESPONSE_BYTES):
+    """
+    Conditional download of a web page(If-None-Match/If-Modified-Since) and extraction of the text of an html section
+    :param url: url of the page
+    :param html_tag: html qualifier indicating the section of the news
+    :param html_attribute: the matching html attribute to select a particular html tag
+    :param etag: the ETag of the previous download - if exists
+    :param last_modified: the Last-Modified of the previous download - if exists
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: read timeout in seconds
+    :param max_bytes: the maximal size of the response body
+    :return: the text of the section, None when the page is not modified, and the ETag and Last-Modified of the page
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    response, content = fetch(url, connect_timeout, read_timeout, max_bytes, headers)
+    if response.status_code == 304:
+        return None, response.headers.get('ETag', etag), response.headers.get('Last-Modified', last_modified)
+    # the charset of the Content-Type header wins, else the encoding is detected from the page
+    encoding = None
+    if 'charset' in response.headers.get('Content-Type', '').lower():
+        encoding = response.encoding
+    return (extract_text(content, html_tag, html_attribute, encoding), response.headers.get('ETag'),
+            response.headers.get('Last-Modified'))
+
+
+def _local_name(tag):
+    """
+    Returns the tag name without its xml namespace
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def extract_feed_links(content):
+    """
+    Extract the article links of an RSS(item/link) or Atom(entry/link href) feed
+    :param content: the feed document
+    :return: list of the article urls, duplicates are kept once in the feed order
+    """
+    links = []
+    for element in ElementTree.fromstring(content).iter():
+        name = _local_name(element.tag)
+        if name == 'item':
+            for child in element:
+                if _local_name(child.tag) == 'link' and child.text and child.text.strip():
+                    links.append(child.text.strip())
+                    break
+        elif name == 'entry':
+            for child in element:
+                if _local_name(child.tag) == 'link' and child.get('href') and \
+                        child.get('rel', 'alternate') == 'alternate':
+                    links.append(child.get('href'))
+                    break
+    return list(dict.fromkeys(links))
+
+
+def fetch_feed_links(url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, max_bytes=MAX_RESPONSE_BYTES):
+    """
+    Download an RSS or Atom feed and extract its article links
+    :param url: url of the feed
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: read timeout in seconds
+    :param max_bytes: the maximal size of the response body
+    :return: list of the article urls
+    """
+    response, content = fetch(url, connect_timeout, read_timeout, max_bytes)
+    return extract_feed_links(content)
@@ -2,20 +2,31 @@
 # SPDX-License-Identifier: MIT-0
 
 import common
+import database
+import itertools
+import loader
+import matcher
 from datetime import datetime
-import os
-import boto3
-import pandas as pd
+import threading
+import time
 import json
 import logging
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
-# Global variable for RDS Connection
-rds_client = None
+# Global variable for the configuration
 config = None
+# Global variable for the in-process indexes of the watchlist, name -> (index, watchlist version, expiry)
+watchlist_indexes = {}
+matcher_lock = threading.Lock()
+# Keywords of at least this length are matched by levenshtein only against the entities holding one of their
+# pigeonhole pieces(see matcher.split_pieces), pieces of 3 characters or more use the trigram index
+PIECE_MIN_KEYWORD_LENGTH = 9
+# Key of the keyword pre-filter in the newsfeed bucket
+PREFILTER_KEY = "watchlist/prefilter.json"
 
 
+@common.metered
 def check_keyword(event, context):
     """
     Check an a keyword/keywords against the watchlist using Fuzzy name matching
@@ -30,12 +41,18 @@ def check_keyword(event, context):
     try:
         req_body = json.loads(event['body'])
         keywords = req_body["keywords"]
+        response_metadata = {}
+        keyword_results = query_keywords(keywords, response_metadata)
         results = []
         for keyword in keywords:
-            statement, parameters = get_keyword_query(keyword)
-            query_result = execute_statement(statement, parameters)
-
-            results.append(query_result)
+            result = {
+                "numberOfRecordsUpdated": 0,
+                "records": keyword_results["{0}".format(keyword)]
+            }
+            # the metadata of the statement that matched the keyword, not available in memory match mode
+            if "{0}".format(keyword) in response_metadata:
+                result["ResponseMetadata"] = response_metadata["{0}".format(keyword)]
+            results.append(result)
     except Exception as e:
         log.error("Error executing check_keyword ", e)
         return {
@@ -55,9 +72,12 @@ def check_keyword(event, context):
     }
 
 
+@common.metered
 def refresh(event, context):
     """
-    This method refresh the watchlist data in the DB, by cleaning the table and reloading new data
+    This method refresh the watchlist data in the DB, the new data is staged and compared with the current table,
+    then only the added and removed records are applied within a single transaction, so the matching keeps using
+    the previous list until the refresh commits. Each refresh creates a new watchlist version
     {
     "refresh_list_from_bucket": false,
     "watchlist": [
@@ -74,7 +94,7 @@ def refresh(event, context):
     log.info("timestamp for message refresh " + wl_timestamp)
     try:
         req_body = json.loads(event['body'])
-        config = common.get_secret(os.environ['SECRET'])
+        config = common.get_config()
         if 'refresh_list_from_bucket' in req_body:
             refresh_list_from_bucket = req_body.get('refresh_list_from_bucket')
         if 'watchlist' in req_body:
@@ -83,19 +103,31 @@ def refresh(event, context):
         log.info(watchlist)
         if refresh_list_from_bucket:
             newsfeed_bucket = config['newsfeed-bucket']
-            input_file = "watchlist/watchlist.csv"
-            s3 = boto3.client('s3')
-            obj = s3.get_object(Bucket=newsfeed_bucket, Key=input_file)
-            csv_data = pd.read_csv(obj['Body'])
-            csv_watchlist = []
-            for i, row in csv_data.iterrows():
-                record = {'entity': row[0], 'entity_type': row[1]}
-                csv_watchlist.append(record)
-            recreate_db()
-            insert_records(csv_watchlist)
+            input_file = config.get('watchlist-key', "watchlist/watchlist.csv")
+            s3 = common.get_client('s3')
+            with common.outbound_slot(), common.timed('s3.get_object'):
+                obj = s3.get_object(Bucket=newsfeed_bucket, Key=input_file)
+            watchlist_loader = loader.WatchlistLoader(obj['Body'], loader.get_watchlist_format(input_file),
+                                                      int(config.get('watchlist-insert-batch-size', 1000)),
+                                                      config.get('watchlist-csv-header', 'auto'))
+            prepare_db()
+            try:
+                refresh_result = apply_watchlist(watchlist_loader.records())
+            finally:
+                obj['Body'].close()
+            load_result = get_load_result(watchlist_loader, refresh_result)
         else:
-            recreate_db()
-            insert_records(watchlist)
+            prepare_db()
+            refresh_result = apply_watchlist(watchlist)
+            load_result = None
+        invalidate_matcher()
+        if common.is_enabled(config.get('watchlist-prefilter', False)):
+            try:
+                refresh_result['prefilter_published'] = publish_prefilter(refresh_result['watchlist_version'])
+            except Exception:
+                # the matching goes on without the pre-filter until the next refresh
+                log.error("Error publishing the keyword pre-filter", exc_info=True)
+                refresh_result['prefilter_published'] = False
         response = execute_statement('select count(*) from WatchList')
         result = response
     except Exception as e:
@@ -110,6 +142,12 @@ def refresh(event, context):
     response = {
         "refresh_list_from_bucket": refresh_list_from_bucket,
         "refresh_list_timestamp": wl_timestamp,
+        "watchlist_version": refresh_result['watchlist_version'],
+        "staged_records": refresh_result['staged_records'],
+        "added_records": refresh_result['added_records'],
+        "removed_records": refresh_result['removed_records'],
+        "load": load_result,
+        "prefilter_published": refresh_result.get('prefilter_published', False),
         "result": result
     }
 
@@ -119,44 +157,162 @@ def refresh(event, context):
     }
 
 
-def recreate_db():
+def get_load_result(watchlist_loader, refresh_result):
+    """
+    Returns the counts of a watchlist file load, and records them in the metrics - the rows read and rejected, the
+    time spent reading them, and the time spent inserting them to the staging table
+    :param watchlist_loader: the loader of the watchlist file
+    :param refresh_result: the result of apply_watchlist
+    :return: dictionary of the counts
+    """
+    load_result = watchlist_loader.get_counts()
+    load_result['insert_ms'] = round(max(refresh_result['staging_ms'] - load_result['read_ms'], 0), 3)
+    common.metrics.add('watchlist.rows', load_result['rows'])
+    common.metrics.add('watchlist.rejected', load_result['rejected'])
+    common.metrics.add('watchlist.read', load_result['read_ms'], 'Milliseconds')
+    common.metrics.add('watchlist.insert', load_result['insert_ms'], 'Milliseconds')
+    log.info("Watchlist file loaded - {0}".format(load_result))
+    return load_result
+
+
+def prepare_db():
     """
-    This method delete the watchlist data
+    This method creates the watchlist tables, the fuzzy matching extensions and the match columns and indexes when
+    missing
     :return:
     """
     execute_statement(get_watchlist_table_sql())
-    execute_statement("truncate table watchlist")
+    execute_statement(get_watchlist_version_table_sql())
     execute_statement('create extension IF NOT EXISTS fuzzystrmatch;')
+    execute_statement('create extension IF NOT EXISTS pg_trgm;')
+    for statement in get_watchlist_index_sql():
+        execute_statement(statement)
+
+
+def apply_watchlist(watchlist):
+    """
+    Replace the watchlist table content with the given watchlist
+    The records are loaded to a staging table, then the records missing from the staging table are deleted and
+    the new records are inserted. Unchanged records are kept as is, and readers see either the previous or the
+    new watchlist since everything runs in one transaction
+    :param watchlist: array or iterable of entity and entity_type values, an iterable is inserted as it is read
+    :return: dictionary with the new watchlist version, the staged/added/removed record counts and the staging time
+    """
+    transaction_id = begin_transaction()
+    try:
+        # Serialize concurrent refreshes, readers are not blocked by this lock mode
+        execute_statement("LOCK TABLE watchlist IN SHARE ROW EXCLUSIVE MODE", transaction_id=transaction_id)
+        execute_statement(get_watchlist_staging_table_sql(), transaction_id=transaction_id)
+        staging_start = time.perf_counter()
+        staged = insert_records(watchlist, transaction_id, 'watchlist_staging')
+        staging_ms = (time.perf_counter() - staging_start) * 1000
+        removed = execute_statement("DELETE FROM watchlist w WHERE NOT EXISTS ("
+                                    "SELECT 1 FROM watchlist_staging s "
+                                    "WHERE s.entity = w.entity AND s.entity_type = w.entity_type)",
+                                    transaction_id=transaction_id)['numberOfRecordsUpdated']
+        added = execute_statement("INSERT INTO watchlist(entity, entity_type, entity_normalized, entity_soundex, "
+                                  "entity_length, create_datetime) "
+                                  "SELECT DISTINCT s.entity, s.entity_type, s.entity_normalized, s.entity_soundex, "
+                                  "s.entity_length, timezone('UTC', now()) "
+                                  "FROM watchlist_staging s WHERE NOT EXISTS ("
+                                  "SELECT 1 FROM watchlist w "
+                                  "WHERE w.entity = s.entity AND w.entity_type = s.entity_type)",
+                                  transaction_id=transaction_id)['numberOfRecordsUpdated']
+        sql_parameters = [
+                            {'name': 'added', 'value': {'longValue': added}},
+                            {'name': 'removed', 'value': {'longValue': removed}}
+                          ]
+        version_result = execute_statement("INSERT INTO watchlist_version(added_records, removed_records, "
+                                           "create_datetime) VALUES(:added, :removed, timezone('UTC', now())) "
+                                           "RETURNING version_id", sql_parameters, transaction_id)
+        commit_transaction(transaction_id)
+    except Exception:
+        rollback_transaction(transaction_id)
+        raise
+    version = version_result['records'][0][0]['longValue']
+    log.info("Watchlist version {0} - staged {1}, added {2}, removed {3}".format(version, staged, added, removed))
+    return {
+        'watchlist_version': version,
+        'staged_records': staged,
+        'added_records': added,
+        'removed_records': removed,
+        'staging_ms': round(staging_ms, 3)
+    }
 
 
-def execute_statement(sql, sql_parameters=[]):
+def get_watchlist_version():
+    """
+    Returns the current watchlist version
+    :return: the latest version id, None when the watchlist was never refreshed
     """
-    Execute a sql statement against an Aurora serverless Data API
+    response = execute_statement("SELECT max(version_id) FROM watchlist_version")
+    return response['records'][0][0].get('longValue')
+
+
+def execute_statement(sql, sql_parameters=[], transaction_id=None):
+    """
+    Execute a sql statement with the configured DB backend(see database.get_backend)
     sql_parameters as a means to prevent SQL injections
     :param sql: the SQL Statement
     :param sql_parameters: sql statement params - if exists
-    :return: the result of the query execution
-    """
-
-    client = get_rds_connection()
-    if sql_parameters:
-        response = client.execute_statement(
-            secretArn=config['db-secret'],
-            database='postgres',
-            resourceArn=config['db-cluster-arn'],
-            sql=sql,
-            parameters=sql_parameters
-        )
-    else:
-        response = client.execute_statement(
-            secretArn=config['db-secret'],
-            database='postgres',
-            resourceArn=config['db-cluster-arn'],
-            sql=sql
-        )
+    :param transaction_id: run the statement within the given transaction - if exists
+    :return: the result of the query execution, in the Data API format
+    """
+    backend = get_db_backend()
+    with common.outbound_slot(), common.timed('rds.execute_statement'):
+        response = backend.execute_statement(sql, sql_parameters, transaction_id)
     return response
 
 
+def batch_execute_statement(sql, sql_parameter_sets, transaction_id=None):
+    """
+    Execute a sql statement once for each parameter set, in a single Data API call or a batch of the Postgres backend
+    :param sql: the SQL Statement
+    :param sql_parameter_sets: list of sql statement params
+    :param transaction_id: run the statement within the given transaction - if exists
+    :return: the result of the batch execution
+    """
+    backend = get_db_backend()
+    with common.outbound_slot(), common.timed('rds.batch_execute_statement'):
+        response = backend.batch_execute_statement(sql, sql_parameter_sets, transaction_id)
+    return response
+
+
+def begin_transaction():
+    """
+    Start a transaction
+    :return: the transaction id
+    """
+    backend = get_db_backend()
+    with common.outbound_slot(), common.timed('rds.begin_transaction'):
+        response = backend.begin_transaction()
+    return response['transactionId']
+
+
+def commit_transaction(transaction_id):
+    """
+    Commit a transaction
+    :param transaction_id: the transaction id
+    :return: the transaction status
+    """
+    backend = get_db_backend()
+    with common.outbound_slot(), common.timed('rds.commit_transaction'):
+        response = backend.commit_transaction(transaction_id)
+    return response['transactionStatus']
+
+
+def rollback_transaction(transaction_id):
+    """
+    Rollback a transaction
+    :param transaction_id: the transaction id
+    :return: the transaction status
+    """
+    backend = get_db_backend()
+    with common.outbound_slot(), common.timed('rds.rollback_transaction'):
+        response = backend.rollback_transaction(transaction_id)
+    return response['transactionStatus']
+
+
 def get_watchlist_table_sql():
     """
     Returns the watchlist DDL table creation SQL Statement
@@ -166,25 +322,100 @@ def get_watchlist_table_sql():
             'entity varchar(255), ' \
             'entity_type varchar(255), ' \
             'create_datetime timestamp, ' \
+            'entity_normalized varchar(255), ' \
+            'entity_soundex varchar(4), ' \
+            'entity_length integer, ' \
             'PRIMARY KEY (entity, entity_type)) '
     return query
 
 
-def insert_records(watchlist):
+def get_watchlist_index_sql():
+    """
+    Returns the SQL Statements adding the match columns and indexes to a watchlist table created without them
+    The lower cased entity, its soundex code and length are stored, Aurora PostgreSQL 10 has no generated columns so
+    they are set by the insert statements, and rows without them are backfilled. The soundex and length columns get
+    a B-tree index and the lower cased entity a trigram index for the LIKE filter of the pigeonhole pieces
+    :return: list of the statements
+    """
+    return [
+        'ALTER TABLE watchlist ADD COLUMN IF NOT EXISTS entity_normalized varchar(255)',
+        'ALTER TABLE watchlist ADD COLUMN IF NOT EXISTS entity_soundex varchar(4)',
+        'ALTER TABLE watchlist ADD COLUMN IF NOT EXISTS entity_length integer',
+        'UPDATE watchlist SET entity_normalized = lower(entity), entity_soundex = soundex(lower(entity)), '
+        'entity_length = char_length(lower(entity)) WHERE entity_normalized IS NULL',
+        'CREATE INDEX IF NOT EXISTS watchlist_entity_soundex_idx ON watchlist(entity_soundex)',
+        'CREATE INDEX IF NOT EXISTS watchlist_entity_length_idx ON watchlist(entity_length)',
+        'CREATE INDEX IF NOT EXISTS watchlist_entity_normalized_trgm_idx ON watchlist '
+        'USING gin(entity_normalized gin_trgm_ops)'
+    ]
+
+
+def get_watchlist_version_table_sql():
     """
-    Iterate on the watchlist values and create and insert records to the watchlist table
-    :param watchlist: array of entity and entity_type values
+    Returns the watchlist version DDL table creation SQL Statement
     :return:
     """
+    query = 'CREATE TABLE IF NOT EXISTS WatchList_Version( ' \
+            'version_id bigserial PRIMARY KEY, ' \
+            'added_records bigint, ' \
+            'removed_records bigint, ' \
+            'create_datetime timestamp) '
+    return query
 
-    for record in watchlist:
-        sql_parameters = [
-                            {'name': 'entity', 'value': {'stringValue': "{0}".format(record["entity"])}},
-                            {'name': 'entity_type', 'value': {'stringValue': "{0}".format(record["entity_type"])}}
-                          ]
-        statement = "INSERT INTO watchlist(entity, entity_type, create_datetime) VALUES(:entity, :entity_type, timezone('UTC', now()))"
-        execute_statement(statement, sql_parameters)
-    execute_statement('commit;')
+
+def get_watchlist_staging_table_sql():
+    """
+    Returns the watchlist staging table creation SQL Statement, the table lives until the end of the transaction
+    :return:
+    """
+    query = 'CREATE TEMPORARY TABLE watchlist_staging( ' \
+            'entity varchar(255), ' \
+            'entity_type varchar(255), ' \
+            'entity_normalized varchar(255), ' \
+            'entity_soundex varchar(4), ' \
+            'entity_length integer) ' \
+            'ON COMMIT DROP'
+    return query
+
+
+def insert_records(watchlist, transaction_id, table_name='watchlist'):
+    """
+    Insert the watchlist values to a watchlist table, in batches of watchlist-insert-batch-size records(default 1000)
+    :param watchlist: array or iterable of entity and entity_type values, only one batch is held in memory
+    :param transaction_id: the transaction the records are inserted in
+    :param table_name: watchlist or watchlist_staging
+    :return: the number of records inserted
+    """
+    get_db_backend()
+    batch_size = int(config.get('watchlist-insert-batch-size', 1000))
+    statement = "INSERT INTO {0}(entity, entity_type, entity_normalized, entity_soundex, entity_length) " \
+                "VALUES(:entity, :entity_type, lower(:entity), soundex(lower(:entity)), " \
+                "char_length(lower(:entity)))".format(table_name)
+    if table_name == 'watchlist':
+        statement = "INSERT INTO watchlist(entity, entity_type, entity_normalized, entity_soundex, entity_length, " \
+                    "create_datetime) VALUES(:entity, :entity_type, lower(:entity), soundex(lower(:entity)), " \
+                    "char_length(lower(:entity)), timezone('UTC', now()))"
+    inserted = 0
+    records = iter(watchlist)
+    while True:
+        sql_parameter_sets = [get_record_parameters(record) for record in itertools.islice(records, batch_size)]
+        if not sql_parameter_sets:
+            return inserted
+        batch_execute_statement(statement, sql_parameter_sets, transaction_id)
+        inserted += len(sql_parameter_sets)
+        log.info("Inserted {0} records to {1}".format(inserted, table_name))
+
+
+def get_record_parameters(record):
+    """
+    Generate the SQL parameters of a watchlist record
+    :param record: dictionary with entity and entity_type values
+    :return: the statement parameters
+    """
+    return [
+        {'name': 'entity', 'value': {'stringValue': "{0}".format(record["entity"])}},
+        {'name': 'entity_type', 'value': {'stringValue': "{0}".format(record["entity_type"])}}
+    ]
 
 
 def get_keyword_query(keyword):
@@ -194,17 +425,240 @@ def get_keyword_query(keyword):
     :return: the statement and statement parameters
     """
     sql_parameters = [{'name': 'input_keyword', 'value': {'stringValue': "{0}".format(keyword)}}]
-    statement = "SELECT * FROM  watchlist WHERE soundex(lower(entity)) = soundex(lower(:input_keyword)) " \
-                "union " \
-                "SELECT * FROM  watchlist WHERE levenshtein_less_equal(lower(entity), lower(:input_keyword),2) <=2"
+    statement = "SELECT m.entity, m.entity_type, m.create_datetime FROM (" + get_match_sql(
+        "SELECT CAST(:input_keyword AS text) AS keyword") + ") m"
     return statement, sql_parameters
 
 
-def get_rds_connection():
-    global rds_client
+def get_match_mode():
+    """
+    Returns the configured watchlist match mode
+    sql - each keyword is matched by a query against the DB (default)
+    memory - keywords are matched by an in-process index of the watchlist table, loaded once per container
+    :return: the match mode
+    """
+    get_db_backend()
+    return config.get('watchlist-match-mode', 'sql')
+
+
+def query_keywords(keywords, response_metadata=None):
+    """
+    Match a list of keywords against the watchlist using the configured match mode
+    In sql mode the keywords are sent in a single statement(up to watchlist-query-batch-size keywords per statement)
+    :param keywords: the keywords to match
+    :param response_metadata: optional dictionary filled with keyword to the ResponseMetadata of its statement
+    :return: dictionary of keyword to its matching records in the Data API format - entity, entity_type, create_datetime
+    """
+    keywords = list(dict.fromkeys("{0}".format(keyword) for keyword in keywords))
+    common.metrics.add('keywords', len(keywords))
+    if get_match_mode() == 'memory':
+        watchlist_index = get_matcher()
+        return {keyword: watchlist_index.match(keyword) for keyword in keywords}
+
+    results = {keyword: [] for keyword in keywords}
+    if common.is_enabled(config.get('watchlist-prefilter', False)):
+        keywords = prefilter_keywords(keywords)
+    batch_size = int(config.get('watchlist-query-batch-size', 500))
+    for start in range(0, len(keywords), batch_size):
+        statement, parameters = get_keywords_query(keywords[start:start + batch_size])
+        query_result = execute_statement(statement, parameters)
+        for rec in query_result['records']:
+            results[rec[0]['stringValue']].append(rec[1:])
+        if response_metadata is not None and 'ResponseMetadata' in query_result:
+            for keyword in keywords[start:start + batch_size]:
+                response_metadata[keyword] = query_result['ResponseMetadata']
+    return results
+
+
+def prefilter_keywords(keywords):
+    """
+    Drop the keywords which cannot match any watchlist entity, see matcher.KeywordPrefilter
+    :param keywords: the keywords
+    :return: the keywords that may match, all of them when the pre-filter is not available
+    """
+    prefilter = get_prefilter()
+    if prefilter is None:
+        return keywords
+    passed = [keyword for keyword in keywords if prefilter.may_match(keyword)]
+    common.metrics.add('prefilter.passed', len(passed))
+    common.metrics.add('prefilter.rejected', len(keywords) - len(passed))
+    log.info("Keyword pre-filter passed {0} of {1} keywords".format(len(passed), len(keywords)))
+    return passed
+
+
+def load_watchlist_records(page_size=5000):
+    """
+    Read the whole watchlist table, page by page to keep each Data API response below its size limit
+    :param page_size: number of records read per statement
+    :return: the watchlist records in the Data API format - entity, entity_type, create_datetime
+    """
+    records = []
+    statement = "SELECT entity, entity_type, create_datetime FROM watchlist " \
+                "ORDER BY entity, entity_type LIMIT {0}".format(int(page_size))
+    page = execute_statement(statement)['records']
+    while page:
+        records.extend(page)
+        if len(page) < page_size:
+            break
+        last_record = page[-1]
+        sql_parameters = [
+                            {'name': 'entity', 'value': {'stringValue': last_record[0]['stringValue']}},
+                            {'name': 'entity_type', 'value': {'stringValue': last_record[1]['stringValue']}}
+                          ]
+        statement = "SELECT entity, entity_type, create_datetime FROM watchlist " \
+                    "WHERE (entity, entity_type) > (:entity, :entity_type) " \
+                    "ORDER BY entity, entity_type LIMIT {0}".format(int(page_size))
+        page = execute_statement(statement, sql_parameters)['records']
+    return records
+
+
+def get_matcher():
+    """
+    Returns the in-process watchlist matcher of the memory match mode
+    :return: the watchlist matcher
+    """
+    return get_watchlist_index('matcher', lambda version: matcher.WatchlistMatcher(load_watchlist_records()))
+
+
+def get_phrase_matcher():
+    """
+    Returns the watchlist phrase matcher, scanning the article texts when watchlist-phrase-scan is enabled
+    :return: the phrase matcher
+    """
+    return get_watchlist_index('phrases', lambda version: matcher.PhraseMatcher(load_watchlist_records()))
+
+
+def get_prefilter():
+    """
+    Returns the keyword pre-filter published by the last refresh, when watchlist-prefilter is enabled
+    :return: the pre-filter, None when the pre-filter of the current watchlist version is not available
+    """
+    return get_watchlist_index('prefilter', load_prefilter)
+
+
+def load_prefilter(version):
+    """
+    Read the keyword pre-filter published to the bucket, a pre-filter of another watchlist version could drop the
+    keywords of the new entities and is not used
+    :param version: the current watchlist version
+    :return: the pre-filter, None when not available
+    """
+    s3 = common.get_client('s3')
+    try:
+        with common.outbound_slot(), common.timed('s3.get_object'):
+            content = s3.get_object(Bucket=config['newsfeed-bucket'], Key=PREFILTER_KEY)['Body'].read()
+    except s3.exceptions.NoSuchKey:
+        log.warning("Keyword pre-filter {0} not found".format(PREFILTER_KEY))
+        return None
+    prefilter = matcher.KeywordPrefilter.from_dict(json.loads(content))
+    if version is None or prefilter.version != version:
+        log.warning("Keyword pre-filter of version {0}, the watchlist version is {1}".format(prefilter.version,
+                                                                                            version))
+        return None
+    return prefilter
+
+
+def publish_prefilter(version):
+    """
+    Build the keyword pre-filter of the watchlist table and save it to the bucket
+    :param version: the watchlist version of the table
+    :return: True when published
+    """
+    prefilter = matcher.KeywordPrefilter.from_records(
+        load_watchlist_records(), float(config.get('watchlist-prefilter-false-positive-rate', 0.01)), version)
+    return common.save_content_to_bucket(config['newsfeed-bucket'], "watchlist", "prefilter", ".json",
+                                         prefilter.to_dict(), "JSON")
+
+
+def get_watchlist_index(name, load):
+    """
+    Returns an in-process index of the watchlist, the watchlist is loaded once per container. Every
+    watchlist-cache-ttl seconds (default 300) the watchlist version is checked and the index is rebuilt
+    when a refresh created a new version
+    :param name: the name of the index
+    :param load: the function loading the index of a watchlist version, the index may be None when not available
+    :return: the index
+    """
+    get_db_backend()
+    cached = watchlist_indexes.get(name)
+    if cached is not None and time.time() < cached[2]:
+        return cached[0]
+    # messages processed in parallel wait for a single load of the watchlist
+    with matcher_lock:
+        now = time.time()
+        cached = watchlist_indexes.get(name)
+        if cached is None or now >= cached[2]:
+            try:
+                version = get_watchlist_version()
+            except Exception:
+                log.warning("Watchlist version is not available", exc_info=True)
+                version = None
+            if cached is None or cached[0] is None or version is None or version != cached[1]:
+                log.info("Loading watchlist {0} for version {1}".format(name, version))
+                index = load(version)
+            else:
+                index = cached[0]
+            cached = (index, version, now + float(config.get('watchlist-cache-ttl', 300)))
+            watchlist_indexes[name] = cached
+    return cached[0]
+
+
+def invalidate_matcher():
+    """
+    Drop the in-process indexes of the watchlist so that the next match reloads the watchlist
+    :return:
+    """
+    watchlist_indexes.clear()
+
+
+def get_keywords_query(keywords):
+    """
+    Generate the SQL Statement and SQL parameters to query the watchlist DB with several keywords at once
+    The keywords are passed as a json array, since the Data API does not support array parameters
+    Each result row starts with the input keyword it matched, followed by the watchlist columns
+    :param keywords: list of keywords
+    :return: the statement and statement parameters
+    """
+    sql_parameters = [{'name': 'input_keywords', 'value': {'stringValue': json.dumps(keywords)}}]
+    statement = get_match_sql("SELECT DISTINCT keyword "
+                              "FROM json_array_elements_text(CAST(:input_keywords AS json)) AS input(keyword)")
+    return statement, sql_parameters
+
+
+def get_match_sql(keywords_sql):
+    """
+    Generate the fuzzy match SQL Statement of keywords, with the same results as joining the keywords with
+    soundex(lower(entity)) = soundex(lower(keyword)) OR levenshtein_less_equal(lower(entity), lower(keyword), 2) <= 2
+    The soundex side uses the entity_soundex index. The levenshtein side only compares the entities at most 2
+    characters longer or shorter, with the entity_length index, and for the keywords of PIECE_MIN_KEYWORD_LENGTH
+    characters or more only the entities holding one of the 3 pieces of the keyword(within 2 edits, one of the pieces
+    is unchanged), found with LIKE through the trigram index
+    :param keywords_sql: the query of the keywords, a keyword column
+    :return: the statement, each result row is the keyword followed by the watchlist columns
+    """
+    pieces_sql = " OR ".join(
+        "w.entity_normalized LIKE '%' || replace(replace(replace(substr(k.keyword_normalized, "
+        "{0} * (k.keyword_length / 3) + least({0}, k.keyword_length % 3) + 1, "
+        "k.keyword_length / 3 + least(greatest(k.keyword_length % 3 - {0}, 0), 1)), "
+        "'\\', '\\\\'), '%', '\\%'), '_', '\\_') || '%' ESCAPE '\\'".format(index)
+        for index in range(matcher.MAX_DISTANCE + 1))
+    return "WITH k AS (SELECT keyword, keyword_normalized, char_length(keyword_normalized) AS keyword_length " \
+           "FROM (SELECT keyword, lower(keyword) AS keyword_normalized FROM (" + keywords_sql + ") i) n) " \
+           "SELECT k.keyword, w.entity, w.entity_type, w.create_datetime " \
+           "FROM k JOIN watchlist w ON w.entity_soundex = soundex(k.keyword_normalized) " \
+           "UNION " \
+           "SELECT k.keyword, w.entity, w.entity_type, w.create_datetime " \
+           "FROM k JOIN watchlist w ON w.entity_length BETWEEN k.keyword_length - 2 AND k.keyword_length + 2 " \
+           "AND (k.keyword_length < {0} OR {1}) " \
+           "AND levenshtein_less_equal(w.entity_normalized, k.keyword_normalized, 2) <= 2".format(
+               PIECE_MIN_KEYWORD_LENGTH, pieces_sql)
+
+
+def get_db_backend():
+    """
+    Returns the configured DB backend, and refreshes the module configuration
+    :return: the DB backend
+    """
     global config
-    if rds_client is None:
-        rds_client = boto3.client('rds-data')
-    if config is None:
-        config = common.get_secret(os.environ['SECRET'])
-    return rds_client
+    config = common.get_config()
+    return database.get_backend(config)